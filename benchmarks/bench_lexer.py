@@ -0,0 +1,42 @@
+"""
+Lexing time of a generated Cels source, alternating `x = x + i;` and `var vi = vi * 2 + 17; /* line i */` lines.
+
+Usage: python bench_lexer.py [-n<lines, 100000>] [-e<engine: dfa, codegen, ...>] [-r<repeats, 3>]
+"""
+import os, sys
+from time import perf_counter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+from cels2tokens import CelsLexer
+
+lines_count = 100000
+engine = 'dfa'
+repeats = 3
+
+for arg in sys.argv[1:]:
+    if arg.startswith('-n'):
+        lines_count = int(arg[2:])
+    elif arg.startswith('-e'):
+        engine = arg[2:]
+    elif arg.startswith('-r'):
+        repeats = int(arg[2:])
+
+def generate_source(lines_count:int)->str:
+    lines = []
+    for i in range(lines_count):
+        lines.append(f"var v{i} = v{i} * 2 + 17; /* line {i} */" if i%2 else f"x = x + {i};")
+    return "\n".join(lines)
+
+text = generate_source(lines_count)
+lexer = CelsLexer(engine=engine)
+lexer.get_automaton()
+
+for name, lex in [("tokenize", lambda: len(lexer.tokenize(text))),
+        ("iter_tokens", lambda: sum(1 for _ in lexer.iter_tokens(text)))]:
+    best = None
+    for _ in range(repeats):
+        start = perf_counter()
+        tokens_count = lex()
+        elapsed = perf_counter()-start
+        if best is None or elapsed<best: best = elapsed
+    print(f"{name:12} {lines_count} lines, {len(text)} chars, {tokens_count} tokens: "
+        f"{best:.2f} s, {tokens_count/best/1000:.0f} ktokens/s ({engine})")
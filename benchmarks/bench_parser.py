@@ -0,0 +1,49 @@
+"""
+LR parse throughput on a source replicated many times (celstris.cels x1000 by default).
+The tokens are lexed beforehand and the rule callbacks do nothing: only the parse loop and its table are timed.
+
+Usage: python bench_parser.py [-f<source.cels>] [-x<copies, 1000>] [-m<table mode, lr1>] [-c (packed table)] [-r<repeats, 3>]
+"""
+import os, sys
+from operator import attrgetter
+from time import perf_counter
+base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(base_dir, "source"))
+from cels2ast import Cels2AST
+from cels2tokens import CelsLexer
+
+source_file = os.path.join(base_dir, "examples", "gba_test2", "cels", "celstris.cels")
+copies = 1000
+mode = 'lr1'
+compress = False
+repeats = 3
+
+for arg in sys.argv[1:]:
+    if arg.startswith('-f'):
+        source_file = arg[2:]
+    elif arg.startswith('-x'):
+        copies = int(arg[2:])
+    elif arg.startswith('-m'):
+        mode = arg[2:]
+    elif arg.startswith('-c'):
+        compress = True
+    elif arg.startswith('-r'):
+        repeats = int(arg[2:])
+
+with open(source_file, encoding="utf8") as f:
+    text = f.read() * copies
+
+grammar, rcf, parser = Cels2AST.shared_parser(lr1_mode=mode, lr1_compress=compress)
+parser = parser.bind([lambda children: None] * len(grammar.rules))
+tokens = list(CelsLexer().iter_tokens(text))
+
+best = None
+for _ in range(repeats):
+    start = perf_counter()
+    result = parser.parse_tokens(tokens, lambda tk: rcf.terminal(tk.token_type), tk2key=attrgetter('token_type'))
+    elapsed = perf_counter()-start
+    if not result['success']: raise RuntimeError(result['message'])
+    if best is None or elapsed<best: best = elapsed
+
+print(f"{os.path.basename(source_file)} x{copies}, {len(tokens)} tokens: {best:.2f} s, "
+    f"{len(tokens)/best/1000:.0f} ktokens/s ({mode}{', packed' if compress else ''})")
@@ -0,0 +1,35 @@
+"""
+Construction time of the regex automata of the Cels token rules, with each RegularExpression method
+(Thompson epsilon-NFA fragments or the combination of deterministic automata at every step).
+The `keywords` line builds one automaton for the union of all the keywords.
+
+Usage: python bench_regex.py [-m<method: thompson, combine, all>] [-r<repeats, 3>]
+"""
+import os, sys
+from time import perf_counter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+from lexer import RegularExpression
+from cels2tokens import CelsTokenTypes
+
+methods = list(RegularExpression.BUILDERS)
+repeats = 3
+
+for arg in sys.argv[1:]:
+    if arg.startswith('-m'):
+        methods = list(RegularExpression.BUILDERS) if arg[2:]=='all' else [arg[2:]]
+    elif arg.startswith('-r'):
+        repeats = int(arg[2:])
+
+token_types = CelsTokenTypes.get_all_types()
+keywords = "|".join(f"({t.regex_str})" for t in token_types if t.name.startswith('KW_'))
+
+for name, regexes in [("rules", [t.regex_str for t in token_types]), ("keywords", [keywords])]:
+    for method in methods:
+        best = None
+        for _ in range(repeats):
+            start = perf_counter()
+            automata = [RegularExpression(regex, method).fa for regex in regexes]
+            elapsed = perf_counter()-start
+            if best is None or elapsed<best: best = elapsed
+        states_count = sum(len(fa.transitions.states) for fa in automata)
+        print(f"{name:9} {len(regexes)} regexes, {states_count} states: {best*1000:.1f} ms ({method})")
@@ -1,6 +1,9 @@
+import os
+from operator import attrgetter
 from lexer import LexicalToken
 from grammar import NonTerminal, Terminal, Epsilon, Grammar, RuleComponent, RuleComponentFactory, rule_callbacks as rc
-from lr1 import LR1Parser
+from lr1 import LR1Parser, IncrementalLR1Parse, ParseProfiler
+from cels_cache import ParseTableCache
 
 from cels_scope import Scope, Symbol, ScopeStack, ScopeNameProvider, ScopeResolveStrategy
 from cels_symbols import DataType, PrimitiveType, Variable, FormalParameter, Function, FunctionOverload, BinaryOperator, OperatorSolver, TaskType, UnaryOperatorType
@@ -13,29 +16,58 @@ from utils import ensure_type
 from cels2tokens import CelsLexer
 
 class Cels2AST:
+    # prebuilt table of the current grammar, seeds the per-user parse table cache
+    SHIPPED_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cels_lr1_at.bin")
+    # (grammar, component factory, parser) by (class, lr1_path, lr1_mode, lr1_compress), built once per process
+    __shared:dict[tuple, tuple[Grammar, RuleComponentFactory, LR1Parser]] = {}
+
     def __init__(self, cels_env:CelsEnvironment|None = None, lr1_path=None,
-        lexer:CelsLexer|None=None):
+        lexer:CelsLexer|None=None, lr1_mode:str='lr1', lr1_compress:bool=False):
         self.env = cels_env or CelsEnvironment.create_default()
 
         self.scope_stack = ScopeStack(self.env.global_scope)
 
-        grammar = self.__create_grammar()
         self.named_scope_stack = []
+        # build_ast_incremental state: parse snapshots, previous source, checkpoint before its first statement
+        self.__incremental:IncrementalLR1Parse|None = None
+        self.__incremental_text:str|None = None
+        self.__incremental_start:tuple|None = None
+        self.__incremental_frozen = False
 
+        grammar, self.rcf, parser = type(self).shared_parser(lr1_path, lr1_mode, lr1_compress)
         print("Grammar hash =",grammar.checksum())
-
-        self.parser = LR1Parser(grammar, lr1_path)
-        if lr1_path is None:
-            self.parser.analysis_table.save("cels_lr1_at.txt")
+        # the reductions of the shared parser, calling the methods of this instance
+        self.parser = parser.bind(grammar.bind_callbacks(self))
 
         def default_import_solver(path):
             raise NotImplementedError("Imports are not implemented")
 
         self.import_solver:callable[[str], ASTNode] = default_import_solver
         self.lexer = lexer or CelsLexer()
+        # statistics of the parses when set (see ParseProfiler)
+        self.profiler:ParseProfiler|None = None
+
+    @classmethod
+    def shared_parser(cls, lr1_path=None, lr1_mode:str='lr1', lr1_compress:bool=False)->tuple[Grammar, RuleComponentFactory, LR1Parser]:
+        """
+        Grammar, component factory and parser shared by the instances of the class in the process. They are built once,
+        for an instance without state: each instance binds the rule callbacks to itself (Grammar.bind_callbacks).
+        The grammar only uses the methods of that instance, the compiler rejects a callback holding it otherwise.
+        """
+        key = (cls, lr1_path, lr1_mode, lr1_compress)
+        shared = Cels2AST.__shared.get(key)
+        if shared is None:
+            template = object.__new__(cls)
+            grammar = template.__create_grammar()
+            if lr1_path is None:
+                lr1_path = ParseTableCache(seeds=[Cels2AST.SHIPPED_TABLE]).prepare(grammar, lr1_mode)
+            shared = grammar, template.rcf, LR1Parser(grammar, lr1_path, lr1_mode, lr1_compress)
+            Cels2AST.__shared[key] = shared
+        return shared
 
     def parse_tokens(self, tokens, verbose=False, debug=False):        
-        parse_result = self.parser.parse_tokens(tokens, lambda tk: self.rcf.terminal(tk.token_type), verbose=verbose)
+        parse_result = self.parser.parse_tokens(tokens, lambda tk: self.rcf.terminal(tk.token_type), verbose=verbose,
+            tk2key=attrgetter('token_type'), profiler=self.profiler)
         if debug:
             print(tokens)
             print(self.env.global_scope.to_str_recursive())
@@ -50,8 +82,80 @@ class Cels2AST:
         #return self.post_process(ast)
 
     def build_ast(self, code:str):
-        tokens = self.lexer.parse(code)['tokens']
-        return self.parse_tokens(tokens)
+        return self.parse_tokens(self.lexer.iter_tokens(code))
+
+    def build_ast_incremental(self, code:str):
+        """
+        build_ast for the successive versions of one source (e.g. in an editor or a watch loop).
+        Each version is parsed from the end of the last top-level statement before its first change:
+        the statements up to there are kept, and the environment is rolled back to its state at
+        that point (see CelsEnvironment.checkpoint). The statements after it are lexed and parsed
+        again, as their symbols and types are resolved against the edited declarations.
+        """
+        if self.__incremental is None:
+            self.__incremental = IncrementalLR1Parse(self.rcf.non_terminal("STMT"), CelsTokenTypes.S_SEMICOLON.name,
+                self.__statement_checkpoint)
+            self.__incremental_start = self.checkpoint()
+            keep = 0
+        else:
+            changed = Cels2AST.common_prefix_length(self.__incremental_text, code)
+            snapshots = self.__incremental.snapshots
+            keep = len(snapshots)
+            # the lexer never matches across a `;` (other than in strings and comments, ended by their
+            # closing delimiter), so the tokens up to a `;` before the change are unchanged
+            while keep>0 and snapshots[keep-1][2][1]>=changed: keep-=1
+
+        start, kept_nodes = 0, 0
+        if keep==0:
+            self.rollback(self.__incremental_start)
+        else:
+            checkpoint, start, _, _, kept_nodes = self.__incremental.snapshots[keep-1][2]
+            self.rollback(checkpoint)
+            # the statement blocks were flattened into the previous parse's top level block
+            for _, _, (_, _, block, children, _) in self.__incremental.snapshots[:keep]:
+                if block is not None:
+                    for child in children: child.set_parent(block, "children")
+        self.__incremental_text = code
+        self.__incremental_frozen = False
+        parse_result = self.parser.parse_incremental(self.lexer.iter_tokens(code, start=start), attrgetter('token_type'),
+            self.__incremental, keep)
+        if not parse_result['success']:
+            raise RuntimeError(parse_result['message'])
+        # the kept statements have no multiframe calls to extract
+        ast = parse_result['value']
+        return self.post_process(ast, ast.children[kept_nodes:])
+
+    def __statement_checkpoint(self, token:LexicalToken, statement):
+        """(checkpoint, end of the `;`, block statement and its children, top level nodes up to there)"""
+        if self.__incremental_frozen or len(self.scope_stack.stack)>1 or len(self.named_scope_stack)>0: return None
+        # post_process rewrites the statements with multiframe calls: they can not be kept as they are
+        if len(Cels2AST.find_multiframe_calls(statement))>0:
+            self.__incremental_frozen = True
+            return None
+        snapshots = self.__incremental.snapshots
+        nodes = snapshots[-1][2][4] if len(snapshots)>0 else 0
+        if isinstance(statement, ASTBlock):
+            children = tuple(statement.children)
+            return self.checkpoint(), token.pos+len(token.value), statement, children, nodes+len(children)
+        return self.checkpoint(), token.pos+len(token.value), None, None, nodes+1
+
+    def checkpoint(self)->tuple:
+        """State of the environment, to roll back to from the top level (outside of any scope)"""
+        return self.env.checkpoint()
+
+    def rollback(self, checkpoint:tuple):
+        self.env.rollback(checkpoint)
+        del self.scope_stack.stack[1:]
+        self.named_scope_stack.clear()
+
+    @staticmethod
+    def common_prefix_length(a:str, b:str)->int:
+        lo, hi = 0, min(len(a), len(b))
+        while lo<hi:
+            mid = (lo+hi+1)//2
+            if a[lo:mid]==b[lo:mid]: lo = mid
+            else: hi = mid-1
+        return lo
 
     def __create_grammar(self):
         self.rcf = rcf = RuleComponentFactory(on_match=lambda val, token: val == token.token_type)
@@ -438,7 +542,7 @@ class Cels2AST:
             ( SCOPE_POP << eps                       ).on_build(rc.call(self.reduce_pop_scope)),
             ( ID_DEFINES_SCOPE << t_id               ).on_build(rc.call(self.reduce_id_defines_scope, rc.arg(0))),
             ( ID_DEFINES_SCOPED_STRUCT << t_id       ).on_build(rc.call(self.reduce_id_defines_scoped_struct, rc.arg(0))),
-        ])
+        ], owner=self)
         return G
 
     def empty_list(self): return []
@@ -806,7 +910,7 @@ class Cels2AST:
         return self.import_solver(path) or self.reduce_block([])
 
     def reduce_package(self, name_token:LexicalToken, block:ASTNodes.Block, scope:Scope):
-        scope.metadata['type']='package'
+        scope.set_metadata('type', 'package')
         return ASTNodes.Package(name_token.value, block, scope)
 
 
@@ -926,24 +1030,35 @@ class Cels2AST:
         if tail is None: return [head]
         return [head] + ensure_type(tail, list)
 
-    def post_process(self, ast):
-        ast = self.__ast_extract_multiframe_calls_in_block(ast)
+    def post_process(self, ast, nodes=None):
+        """nodes: the top level nodes of the ast to process, all of them by default"""
+        ast = self.__ast_extract_multiframe_calls_in_block(ast, nodes)
         return ast
 
     def gen_internal_var_name(self):
         return f"cels_s{self.env.internal_sym_id_provider.create_id()}"
 
-    def __ast_extract_multiframe_calls_in_block(self, ast):
-        stack = [ast]
-
+    @staticmethod
+    def find_multiframe_calls(node)->list[ASTNodes.FunOverloadCall]:
+        """Multiframe calls in the node, except the ones launched by a multiframe statement"""
         mf_calls = []
-        def identify_multiframe_calls(node):            
+        def identify_multiframe_calls(node):
             if isinstance(node, ASTNodes.MultiframeLaunch):
                 return True
             if isinstance(node, ASTNodes.FunOverloadCall) and node.function_overload.is_multiframe:
                 mf_calls.append(node)
                 return True
             return False
+        node.parse(identify_multiframe_calls)
+        return mf_calls
+
+    def __ast_extract_multiframe_calls_in_block(self, ast, nodes=None):
+        stack = [ast]
+
+        def multiframe_calls(node):
+            if node is ast and nodes is not None:
+                return [mf_call for n in nodes for mf_call in self.find_multiframe_calls(n)]
+            return self.find_multiframe_calls(node)
 
         def extract_mf_call(mf_call):
             # Converts Expr(mfcall(x)) to internal_var = mf_call(x); Expr(internal_var)
@@ -995,12 +1110,10 @@ class Cels2AST:
             return result
 
         while len(stack)>0:
-            mf_calls.clear()
             node = stack[-1]
             stack.pop()
-            node.parse(identify_multiframe_calls)
 
-            for mf_call in mf_calls:
+            for mf_call in multiframe_calls(node):
                 extracts = extract_mf_call(mf_call)
                 for extract in extracts:
                     for child in extract.enumerate_children():
@@ -3,10 +3,11 @@ from ast_base import ASTNode, ASTBlock
 from cels_ast_nodes import ASTNodes
 from cels2ast import Cels2AST
 from cels_env import CelsEnvironment
-from cels_scope import Symbol
+from cels_scope import Symbol, Scope
 from cels_symbols import DataType, PrimitiveType, StructType, Field, FunctionOverload, Function, FormalParameter, UnaryOperatorType, Variable
-from cels_multiframe import MultiFrameCFGNode, PseudoAST_PreMultiframeFunCall, PseudoAST_PostMultiframeFunCall, MultiframeCFG
+from cels_multiframe import MultiFrameCFGNode, PseudoAST_PreMultiframeFunCall, PseudoAST_PostMultiframeFunCall, PseudoAST_Sequence, MultiframeCFG
 from utils import ensure_type, indent, IdProvider
+from collections import deque
 
 class CppSnippet:
     def __init__(self,
@@ -151,13 +152,16 @@ class CelsEnv2Cpp:
 
     def compile_env(self)->CppSnippet:
 
+        # C++ namespace path of the scopes, up to the first anonymous one
+        scope_paths:dict[Scope, tuple[str, ...]] = {}
+        def scope2cpp(scope:Scope|None)->tuple[str, ...]:
+            if scope is None or scope.name.startswith('@'): return ()
+            path = scope_paths.get(scope)
+            if path is None: path = scope_paths[scope] = scope2cpp(scope.parent) + (scope.name, )
+            return path
+
         def symbol2cpp(symbol:Symbol, headers:list[str]|None=None)->CppIdentifier:
-            path = [symbol.name]
-            scope = symbol.scope
-            while scope is not None and not scope.name.startswith('@'):
-                path.append(scope.name)
-                scope = scope.parent
-            full_name = '::'.join(path[::-1])
+            full_name = '::'.join((*scope2cpp(symbol.scope), symbol.name))
             return CppIdentifier(symbol, symbol.name, full_name, headers)
 
         self.identify_symbol(self.env.dtype_bool, CppIdentifier(self.env.dtype_bool, "bool"))
@@ -304,18 +308,19 @@ class CelsEnv2Cpp:
         frag_dict = { frag.ref_obj:frag for frag in fragments }
 
         root = object()
-        dep_graph = {root:set()}
+        # adjacency kept in insertion order (dicts), so the emitted order does not depend on hashes or addresses
+        dep_graph = {root:{}}
         incoming_edges_count = {root:0}
 
         def add_dependency(x,y):
-            if not x in dep_graph: dep_graph[x] = set()
+            if not x in dep_graph: dep_graph[x] = {}
             if not y in incoming_edges_count: incoming_edges_count[y] = 0
             if y in dep_graph[x]: return
-            dep_graph[x].add(y)
+            dep_graph[x][y] = None
             incoming_edges_count[y]+=1
 
         def remove_dependency(x,y):
-            dep_graph[x].remove(y)
+            del dep_graph[x][y]
             incoming_edges_count[y]-=1
 
         def get_next_nodes(x):
@@ -325,14 +330,14 @@ class CelsEnv2Cpp:
 
         def remember_dependency(deps, item):
             if item in frag_dict.keys():
-                deps.add(item)
+                deps[item] = None
             if isinstance(item, DataType):
                 if item.is_pointer or item.is_static_array or item.is_task:
                     remember_dependency(deps, item.element_type)
 
         for fragment in fragments:
             ref = fragment.ref_obj
-            deps = set()
+            deps = {}
 
             if isinstance(ref, FunctionOverload):
                 for param in ref.params:
@@ -350,15 +355,15 @@ class CelsEnv2Cpp:
 
         # sort topologically - Kahn's algorithm
         L = []
-        S = set([root])
+        S = deque([root])
 
         while len(S)>0:
-            n = S.pop()
+            n = S.popleft()
             L.append(n)
             for m in get_next_nodes(n):
                 remove_dependency(n, m)
                 if incoming_edges_count[m]==0:
-                    S.add(m)
+                    S.append(m)
 
         if sum(incoming_edges_count.values())>0:
             raise RuntimeError("__sort_fragments: cyclic dependencies")
@@ -538,8 +543,7 @@ class CelsEnv2Cpp:
 
         return defi, impl
 
-    # Compilation is a destructive process!
-    # it alters overload.implementation
+    # The CFG only references overload.implementation, the AST is left intact
     def __compile_function_overload_multiframe_frag(self, overload:FunctionOverload, namespace)->CppFragment:
 
         fragment = CppFragment(overload, namespace)
@@ -719,9 +723,9 @@ class CelsEnv2Cpp:
             if b is not None: return b
 
         snippet = CppSnippet([])
-        if isinstance(node, ASTBlock):
+        if isinstance(node, ASTBlock) or isinstance(node, PseudoAST_Sequence):
             snippet+="{\n"
-            for c in node.children:
+            for c in (node.nodes if isinstance(node, PseudoAST_Sequence) else node.children):
                 snippet += [self.__compile_ast_node(c, prio_build).indent(), ";\n"]
             snippet+="}\n"
             return snippet
@@ -107,34 +107,39 @@ class CelsTokenTypes:
             key=lambda t:t.token_type_id)
 
 class CelsLexer(Lexer):
-    def __init__(self):
-        Lexer.__init__(self)
+    TRIVIA = (CelsTokenTypes.WS.name, CelsTokenTypes.COMMENT.name)
+
+    def __init__(self, cache_path:str|None=None, engine:str='dfa', module_path:str|None=None, keyword_table:bool=False):
+        Lexer.__init__(self, engine=engine, cache_path=cache_path, module_path=module_path, keyword_table=keyword_table)
         for token_type in CelsTokenTypes.get_all_types():
             self.add_rule(token_type.name, token_type.regex_str)
+        names = [t.name for t in CelsTokenTypes.get_all_types()]
+        self._separated = [(a, b) for a in names for b in names if CelsLexer.is_space_not_allowed(a, b)]
 
-    def parse(self, text):
-        result = Lexer.parse(self, text)
-
-        if not result['success']: return result
-
-        tokens = result['tokens']
-
-        def is_space_not_allowed_h(tk1, tk2):
-            return tk1.token_type.startswith('LITERAL_') and (tk2.token_type.startswith('LITERAL_') or tk2.token_type.startswith('KW_'))
-        def is_space_not_allowed(tk1, tk2):
-            return is_space_not_allowed_h(tk1, tk2) or is_space_not_allowed_h(tk2, tk1)
+    @staticmethod
+    def is_space_not_allowed(type1:str, type2:str)->bool:
+        def is_space_not_allowed_h(t1, t2):
+            return t1.startswith('LITERAL_') and (t2.startswith('LITERAL_') or t2.startswith('KW_'))
+        return is_space_not_allowed_h(type1, type2) or is_space_not_allowed_h(type2, type1)
 
-        for i in range(len(tokens)-1):
-            tk1, tk2 = tokens[i], tokens[i+1]
-            if is_space_not_allowed(tk1, tk2):
-                return {
-                    'tokens':tokens,
-                    'success':False,
-                    'error': f'There must be a space between consecutive literals and/or keywords (at {(tk2.row, tk2.col)})'
-                }
+    def separation_error(self, token1, token2):
+        return f'There must be a space between consecutive literals and/or keywords (at {(token2.row, token2.col)})'
 
-        tokens = list(filter(lambda t:t.token_type!="WS", tokens))
+    def tokenize(self, text, skip=TRIVIA, separated=None):
+        """Token buffer without white spaces and comments by default, separated: the Cels pairs if None"""
+        return Lexer.tokenize(self, text, skip, self._separated if separated is None else separated)
 
-        result['tokens'] = [tk for tk in tokens if tk.token_type!=CelsTokenTypes.COMMENT.name]
+    def iter_tokens(self, text, skip=TRIVIA, separated=None, start=0):
+        """Tokens as tokenize, lexed on demand from index `start` (the end of a token)"""
+        return Lexer.iter_tokens(self, text, skip, self._separated if separated is None else separated, start)
 
-        return result
\ No newline at end of file
+    def parse(self, text):
+        tokens = self.tokenize(text)
+        if tokens.success:
+            return {'tokens':list(tokens), 'success':True}
+        # errors are reported along with all the tokens, white spaces and comments included
+        result = Lexer.parse(self, text)
+        if result['success']:
+            result['success'] = False
+            result['error'] = tokens.error
+        return result
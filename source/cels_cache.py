@@ -0,0 +1,75 @@
+"""
+Per-user cache of LR parse tables.
+
+Tables are binary files named after the grammar fingerprint (sha256 of the rules) and the
+table mode, so several grammar versions live side by side and a table is only rebuilt when
+no file matches. Files are written through a temporary sibling and a rename: parallel
+builds (e.g. make -j) may both build a missing table, but never read a partial one.
+
+Usage:
+    path = ParseTableCache(seeds=["cels_lr1_at.bin"]).prepare(grammar, 'lr1')
+    parser = LR1Parser(grammar, path, 'lr1') # loads the table, or builds and saves it to path
+"""
+
+from __future__ import annotations
+import os, sys
+from grammar import Grammar
+from lr1 import LR1AnalysisTable
+from utils import atomic_write
+
+def user_cache_dir(app:str="cels")->str:
+    """$CELS_CACHE_DIR if set, otherwise the platform's per-user cache directory"""
+    override = os.environ.get("CELS_CACHE_DIR")
+    if override: return override
+    if sys.platform=="win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform=="darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, app)
+
+class ParseTableCache:
+    def __init__(self, directory:str|None=None, seeds:list[str]=()):
+        """seeds: prebuilt binary tables (e.g. shipped with the sources), copied in on a miss if they match"""
+        self.directory = directory or user_cache_dir()
+        self.seeds = list(seeds)
+
+    def path(self, grammar:Grammar, mode:str, compressed:bool=False)->str:
+        """compressed: the packed table, which LR1Parser(compress=True) keeps next to the dense one"""
+        path = os.path.join(self.directory, f"lr1-{mode}-{grammar.fingerprint()}.bin")
+        return LR1AnalysisTable.packed_path(path) if compressed else path
+
+    def entries(self)->list[str]:
+        if not os.path.isdir(self.directory): return []
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith("lr1-") and name.endswith(".bin"))
+
+    def prepare(self, grammar:Grammar, mode:str)->str|None:
+        """
+        Path of the cached (dense) table for the grammar and mode, filled from a matching seed if missing.
+        None if the cache directory can not be created: the table is then built in memory.
+        """
+        path = self.path(grammar, mode)
+        if os.path.exists(path): return path
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            print(f"Parse table cache: could not create {self.directory}: {e}")
+            return None
+
+        fingerprint = grammar.fingerprint()
+        for seed in self.seeds:
+            if not os.path.exists(seed): continue
+            with open(seed, 'rb') as f:
+                data = f.read()
+            header, _ = LR1AnalysisTable.binary_header(data) or ({}, 0)
+            if header.get('version')==LR1AnalysisTable.BINARY_VERSION and header.get('fingerprint')==fingerprint \
+                and header.get('mode')==mode and not 'compressed' in header:
+                try:
+                    atomic_write(path, data)
+                except OSError as e:
+                    print(f"Parse table cache: could not copy {seed}: {e}")
+                    return seed
+                break
+        return path
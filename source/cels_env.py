@@ -1,5 +1,5 @@
 from __future__ import annotations
-from cels_scope import Scope, Symbol, ScopeStack, ScopeNameProvider, ScopeResolveStrategy
+from cels_scope import Scope, Symbol, ScopeStack, ScopeNameProvider, ScopeResolveStrategy, ScopeJournal
 from cels_symbols import Variable, FormalParameter, Function, FunctionOverload, BinaryOperator, IndexerArchetype, Indexer, UnaryOperatorType
 from cels_symbols import OperatorSolver
 from cels_symbols import DataType, PrimitiveType, StructType, Field
@@ -8,7 +8,8 @@ from utils import IdProvider
 
 class CelsEnvironment:
     def __init__(self):
-        self._global_scope = Scope("", None)
+        self._journal = ScopeJournal()
+        self._global_scope = Scope("", None, journal=self._journal)
         self._op_solver = OperatorSolver()
         self._scope_name_provider = ScopeNameProvider()
         self._sym_id_provider = IdProvider()
@@ -42,6 +43,27 @@ class CelsEnvironment:
     @property
     def scope_name_provider(self)->ScopeNameProvider: return self._scope_name_provider
 
+    @property
+    def journal(self)->ScopeJournal: return self._journal
+
+    def checkpoint(self)->tuple:
+        """Current state of the scopes and id providers, see rollback. Starts journaling the scope changes."""
+        self._journal.active = True
+        return (self._journal.mark(), self._scope_name_provider.counter,
+            self._sym_id_provider.last_id, self._internal_sym_id_provider.last_id)
+
+    def rollback(self, checkpoint:tuple):
+        """
+        Removes the scopes, symbols and overloads added since the checkpoint,
+        the next scopes and symbols get the ids they got after the checkpoint
+        """
+        mark, scope_counter, sym_id, internal_sym_id = checkpoint
+        self._journal.rollback(mark)
+        self._global_scope.resolution_cache.clear()
+        self._scope_name_provider.counter = scope_counter
+        self._sym_id_provider.restore(sym_id)
+        self._internal_sym_id_provider.restore(internal_sym_id)
+
     def add_symbol(self, scope, symbol_creator)->Symbol:
         symbol = scope.add_symbol(symbol_creator)
         symbol.metadata['sid'] = self._sym_id_provider.create_id()
@@ -1,9 +1,13 @@
 from cels_modular import ModularCels2AST
 from cels2cpp import CelsEnv2Cpp
+from cels2tokens import CelsLexer
+from lr1 import ParseProfiler
+from cels_cache import user_cache_dir
 import sys, os
 
 source_dir = None
 out_file = None
+profile_file = None
 cpp_headers = []
 
 for arg in sys.argv[1:]:
@@ -11,6 +15,8 @@ for arg in sys.argv[1:]:
         source_dir = arg[2:]
     elif arg.startswith('-o'):
         out_file = arg[2:]
+    elif arg.startswith('-p'):
+        profile_file = arg[2:]
     if arg.startswith("-he"):
         cpp_headers.append(f'#include <{arg[3:]}>\n')
     if arg.startswith("-hi"):
@@ -24,8 +30,18 @@ if out_file is None:
     print("Output file not specified (-o/.../output.cels.hpp)")
     exit(-1)
 
-c2a = ModularCels2AST(lr1_path=os.path.join(os.path.dirname(__file__), "cels_lr1_at.txt"))
+# the lexer automaton and its generated module are kept with the parse tables, out of the sources
+cache_dir = user_cache_dir()
+os.makedirs(cache_dir, exist_ok=True)
+c2a = ModularCels2AST(lexer=CelsLexer(cache_path=os.path.join(cache_dir, "cels_lexer_dfa.json"),
+        engine='codegen', module_path=os.path.join(cache_dir, "cels_lexer_gen.py"), keyword_table=True))
+if profile_file is not None:
+    c2a.profiler = ParseProfiler()
 ast = c2a.compile_from_folder(source_dir)
+if profile_file is not None:
+    print(c2a.profiler.report(limit=25))
+    c2a.profiler.save_json(profile_file)
+    print("Resolution cache:", c2a.env.global_scope.resolution_cache.stats())
 
 e2cpp = CelsEnv2Cpp(c2a.env)
 snippet = e2cpp.compile_env()
@@ -1,5 +1,6 @@
 from ast_base import ASTBlock
 from cels2ast import Cels2AST
+from cels2tokens import CelsLexer
 from cels_env import CelsEnvironment
 import os
 
@@ -34,10 +35,20 @@ class ImportSolver:
         return ast
 
 class ModularCels2AST(Cels2AST):
-    def __init__(self, cels_env:CelsEnvironment|None = None, lr1_path=None):
-        Cels2AST.__init__(self, cels_env, lr1_path)
+    def __init__(self, cels_env:CelsEnvironment|None = None, lr1_path=None, lexer:CelsLexer|None=None,
+        lr1_mode:str='lr1', lr1_compress:bool=False):
+        Cels2AST.__init__(self, cels_env, lr1_path, lexer, lr1_mode, lr1_compress)
         self.import_solver = ImportSolver(self)
 
+    # the imports after a checkpoint are rolled back with the environment, they are solved again
+    def checkpoint(self)->tuple:
+        return Cels2AST.checkpoint(self), frozenset(self.import_solver.paths_done)
+
+    def rollback(self, checkpoint:tuple):
+        env_checkpoint, paths_done = checkpoint
+        Cels2AST.rollback(self, env_checkpoint)
+        self.import_solver.paths_done = set(paths_done)
+
     def compile_from_folder(self, dir_path):
         dir_path = os.path.abspath(dir_path)
         self.import_solver.base_dir = dir_path
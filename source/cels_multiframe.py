@@ -140,6 +140,16 @@ class PseudoAST_PostMultiframeFunCall(ASTNode):
         self.funcall = funcall
         self.result_lhs = result_lhs
 
+# Groups instructions without taking ownership of them, so the function's AST is left intact
+class PseudoAST_Sequence(ASTNode):
+    def __init__(self, *nodes):
+        ASTNode.__init__(self)
+        self.nodes = []
+        for n in nodes:
+            if isinstance(n, PseudoAST_Sequence): self.nodes += n.nodes
+            elif isinstance(n, ASTNodes.Block): self.nodes += PseudoAST_Sequence(*n.children).nodes
+            else: self.nodes.append(n)
+
 class MultiframeCFG:
     def __init__(self, overload: FunctionOverload):
         assert isinstance(overload, FunctionOverload)
@@ -347,6 +357,6 @@ class MultiframeCFG:
         ipairs = create_ipairs()
         while len(ipairs)>0:
             for n0, n1 in ipairs:
-                n0.ast = ASTNodes.Block(n0.ast, n1.ast)
+                n0.ast = PseudoAST_Sequence(n0.ast, n1.ast)
                 n0.next_nodes = n1.next_nodes
             ipairs = create_ipairs()
@@ -1,16 +1,20 @@
 from __future__ import annotations
-from utils import ensure_type, indent
+from utils import ensure_type, indent, Interner
 
 class Symbol:
     def __init__(self, name:str, scope:Scope):
         self._name:str = ensure_type(name, str)
         self._scope:Scope = ensure_type(scope, Scope)
         self._full_name = self._scope.get_full_name() + self._scope._sp.separator + self._name
-        self._hash_code = hash(self._full_name)
+        self._interner = self._scope.interner
+        self._iid = self._interner(self._full_name)
         self._metadata = {}
 
     def get_full_name(self): return self._full_name
 
+    @property
+    def iid(self)->int: return self._iid
+
     @property
     def metadata(self): return self._metadata
 
@@ -22,8 +26,9 @@ class Symbol:
 
     def __str__(self): return self.get_full_name()
 
-    def __eq__(self, other): return isinstance(other, type(self)) and self._full_name==other._full_name
-    def __hash__(self): return self._hash_code
+    # ids are given per scope tree (environment): the objects of other trees are never equal
+    def __eq__(self, other): return isinstance(other, type(self)) and self._iid==other._iid and self._interner is other._interner
+    def __hash__(self): return self._iid
 
     def is_in_scope(self, scope:Scope):
         s = self.scope
@@ -38,6 +43,82 @@ class ScopeResolveStrategy:
     GET_OR_CREATE = GET + CREATE
 
 
+class ScopeJournal:
+    """
+    Undo log of the additions to a scope tree (scopes, symbols, overloads, visible scopes) and of the
+    scope metadata writes, recorded while active. rollback(mark) undoes the changes made since mark(), latest first.
+    """
+    _MISSING = object()
+
+    def __init__(self):
+        self.active = False
+        self._undo:list[tuple[list|set|dict, any]] = []
+
+    def appended(self, items:list, item):
+        if self.active: self._undo.append((items, item))
+
+    def added(self, items:set, item):
+        if self.active: self._undo.append((items, item))
+
+    def assigned(self, items:dict, key):
+        """To call before items[key] is set"""
+        if self.active: self._undo.append((items, (key, items.get(key, ScopeJournal._MISSING))))
+
+    def mark(self)->int: return len(self._undo)
+
+    def rollback(self, mark:int):
+        undo = self._undo
+        while len(undo)>mark:
+            items, item = undo.pop()
+            if isinstance(items, set): items.discard(item)
+            elif isinstance(items, dict):
+                key, previous = item
+                if previous is ScopeJournal._MISSING: items.pop(key, None)
+                else: items[key] = previous
+            # items appended while inactive may follow the item
+            elif items[-1] is item: items.pop()
+            else: items.remove(item)
+
+class ResolutionCache:
+    """
+    Symbols resolved from the scopes of a tree, by (scope, path). A resolution only depends on the scopes
+    and symbols named like the parts of its path, and on the visible scopes: an entry holds the generations
+    of these names and of the visibility, bumped by the additions, and is stale once one of them changed.
+    Removals (ScopeJournal.rollback) must clear() the cache.
+    """
+    def __init__(self):
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._generations:dict[str, int] = {}
+        self._visibility = 0
+        self._entries:dict[tuple, tuple] = {}
+
+    def changed(self, name:str): self._generations[name] = self._generations.get(name, 0)+1
+
+    def visibility_changed(self): self._visibility += 1
+
+    def clear(self): self._entries.clear()
+
+    def _stamp(self, names)->tuple:
+        generations = self._generations
+        return (self._visibility, *[generations.get(n, 0) for n in names])
+
+    def get(self, key:tuple, names)->tuple|None:
+        """(value, ) if the entry is up to date"""
+        if not self.enabled: return None
+        entry = self._entries.get(key)
+        if entry is not None and entry[1]==self._stamp(names):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key:tuple, names, value):
+        if self.enabled: self._entries[key] = (value, self._stamp(names))
+
+    def stats(self)->dict: return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
 class ScopeException(Exception):
     def __init__(self, message):
         super(ScopeException, self).__init__(message)
@@ -58,19 +139,27 @@ class SeparatorProvider:
         return SeparatorProvider._Default_instance
 
 class Scope:
-    def __init__(self, name: str, parent:Scope|None, separator_provider:SeparatorProvider|None=None):
+    def __init__(self, name: str, parent:Scope|None, separator_provider:SeparatorProvider|None=None,
+        journal:ScopeJournal|None=None, resolution_cache:ResolutionCache|None=None, interner:Interner|None=None):
         self._name:str = ensure_type(name, str)
         self._parent:Scope|None = ensure_type(parent, Scope, None)
         self._sp = separator_provider or (parent._sp if parent is not None else None)
         if self._sp is None:
             self._sp = SeparatorProvider.Default()
+        self._journal = journal or (parent._journal if parent is not None else None)
+        self._resolution_cache = resolution_cache or (parent._resolution_cache if parent is not None else ResolutionCache())
+        # ids of the full names of the scopes, symbols and data types of the tree, which compare and hash by these ids
+        self._interner = interner or (parent._interner if parent is not None else Interner())
         self._visible_scopes:set[Scope] = set()
         self._symbol_aliases:dict[str, Scope] = {}
         self._child_scopes:list[Scope] = []
         self._child_symbols:list[Symbol] = []
+        # children by name, kept with the lists (lists of a name may be left empty by a rollback)
+        self._scopes_by_name:dict[str, list[Scope]] = {}
+        self._symbols_by_name:dict[str, list[Symbol]] = {}
 
         self._full_name = self._sp.separator.join(self.get_full_path())
-        self._hash_code = hash(self._full_name)
+        self._iid = self._interner(self._full_name)
 
         self._associated_symbol = None
 
@@ -91,12 +180,24 @@ class Scope:
     @property
     def parent(self): return self._parent
 
+    @property
+    def journal(self)->ScopeJournal|None: return self._journal
+
+    @property
+    def resolution_cache(self)->ResolutionCache: return self._resolution_cache
+
+    @property
+    def interner(self)->Interner: return self._interner
+
+    @property
+    def iid(self)->int: return self._iid
+
     def __str__(self): return self.get_full_name()
 
     def __eq__(self, other):
-        return isinstance(other, Scope) and other.get_full_name()==self.get_full_name()
+        return isinstance(other, Scope) and other._iid==self._iid and other._interner is self._interner
 
-    def __hash__(self): return self._hash_code
+    def __hash__(self): return self._iid
 
     def get_full_path(self)->list[str]:
         path = []
@@ -115,12 +216,18 @@ class Scope:
 
         if index==len(path): return self
 
-        scope_candidates = [scope for scope in self._child_scopes if scope.name==path[index]]
+        scope_candidates = self._scopes_by_name.get(path[index], ())
 
         if len(scope_candidates)==0:
             if strat_create:
                 new_scope = Scope(name=path[index], parent=self)
                 self._child_scopes.append(new_scope)
+                named = self._scopes_by_name.setdefault(new_scope.name, [])
+                named.append(new_scope)
+                self._resolution_cache.changed(new_scope.name)
+                if self._journal is not None:
+                    self._journal.appended(self._child_scopes, new_scope)
+                    self._journal.appended(named, new_scope)
                 return new_scope._get_subscope_helper(path, index+1, strategy)
             raise ScopeException(f"Scope does not exist: {self.get_full_name()}{separator}{path[index]}")
 
@@ -140,25 +247,36 @@ class Scope:
         return self._get_subscope_helper(path, 0, strategy)
 
     def add_visible_scope(self, scope:Scope):
+        if scope in self._visible_scopes: return
         self._visible_scopes.add(scope)
+        if self._journal is not None: self._journal.added(self._visible_scopes, scope)
+        self._resolution_cache.visibility_changed()
+
+    def set_metadata(self, key:str, value):
+        """metadata[key] = value, undone by a journal rollback"""
+        if self._journal is not None: self._journal.assigned(self._metadata, key)
+        self._metadata[key] = value
 
     def add_symbol(self, symbol_creator: callable[[Scope], Symbol])->Symbol:
         symbol = symbol_creator(self)
-        if any(map(lambda s:s.name==symbol.name, self._child_symbols)):
+        named = self._symbols_by_name.setdefault(symbol.name, [])
+        if len(named)>0:
             raise ScopeException(f"Duplicate symbol: {symbol.name} under {self.get_full_name()}")
         self._child_symbols.append(symbol)
+        named.append(symbol)
+        self._resolution_cache.changed(symbol.name)
+        if self._journal is not None:
+            self._journal.appended(self._child_symbols, symbol)
+            self._journal.appended(named, symbol)
         return symbol
 
     def _resolve_symbol_helper(self, path:list[str], index:int):
         if index==len(path): return self
         if index==len(path)-1:
-            candidate_symbols = [sym for sym in self._child_symbols if sym.name==path[index]]
-            if len(candidate_symbols)==0:
-                return []
-            return candidate_symbols
+            return self._symbols_by_name.get(path[index], [])
 
-        candidate_scopes = [scope for scope in self._child_scopes if scope.name==path[index]]
-        if len(candidate_scopes)==0:
+        candidate_scopes = self._scopes_by_name.get(path[index])
+        if not candidate_scopes:
             return []
         return candidate_scopes[0]._resolve_symbol_helper(path, index+1)
 
@@ -166,28 +284,26 @@ class Scope:
         ensure_type(name, str)
         separator = self._sp.separator
 
-        candidate_symbols = []
-        for symbol in self._child_symbols:
-            if symbol.name==name:
-                candidate_symbols.append(symbol)
-
-        candidate_symbols = list(set(candidate_symbols))
+        candidate_symbols = self._symbols_by_name.get(name)
 
-        if len(candidate_symbols)==0:
+        if not candidate_symbols:
             return None
 
         if len(candidate_symbols)>1:
-            sym_name = self._sp.separator.join(path)
+            sym_name = name
             matches = ", ".join(map(str, candidate_symbols))
             raise ScopeException(f"Ambiguous symbol {sym_name}. Found matches: {matches}")
         return candidate_symbols[0]
 
     def try_resolve_upper_immediate_symbol(self, name:str)->Symbol|None:
+        key = (self, name)
+        cached = self._resolution_cache.get(key, (name, ))
+        if cached is not None: return cached[0]
         candidate = self.try_resolve_immediate_symbol(name)
-        if candidate is not None:
-            return candidate
-        if self.parent is None: return None
-        return self.parent.try_resolve_upper_immediate_symbol(name)
+        if candidate is None and self.parent is not None:
+            candidate = self.parent.try_resolve_upper_immediate_symbol(name)
+        self._resolution_cache.put(key, (name, ), candidate)
+        return candidate
 
 
 
@@ -196,6 +312,10 @@ class Scope:
         if isinstance(path, str):
             path = path.split(separator)
         ensure_type(path, list)
+        # paths are keyed as tuples, names of try_resolve_upper_immediate_symbol as strings
+        key = (self, tuple(path))
+        cached = self._resolution_cache.get(key, path)
+        if cached is not None: return cached[0]
 
         candidate_symbols = []
         # Look in current scope
@@ -208,7 +328,8 @@ class Scope:
         for vscope in self._visible_scopes:
             candidate_symbols += vscope._resolve_symbol_helper(path, 0)
 
-        candidate_symbols = list(set(candidate_symbols))
+        if len(candidate_symbols)>1:
+            candidate_symbols = list(set(candidate_symbols))
 
         if len(candidate_symbols)==0:
             sym_name = self._sp.separator.join(path)
@@ -218,6 +339,7 @@ class Scope:
             sym_name = self._sp.separator.join(path)
             matches = ", ".join(map(str, candidate_symbols))
             raise ScopeException(f"Ambiguous symbol {sym_name}. Found matches: {matches}")
+        self._resolution_cache.put(key, path, candidate_symbols[0])
         return candidate_symbols[0]
 
     def enumerate_subscopes(self):
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from utils import ensure_type
+from utils import ensure_type, Interner
 from cels_scope import Symbol, Scope
 
 class SymbolException(Exception):
@@ -7,14 +7,19 @@ class SymbolException(Exception):
         super().__init__(message)
 
 class DataType:
-    def __init__(self, full_name:str):
+    def __init__(self, full_name:str, interner:Interner):
+        """interner: of the scope tree the type belongs to (see Scope.interner)"""
         self._full_name = ensure_type(full_name, str)
-        self._hash_code = hash(self._full_name)
+        self._interner = ensure_type(interner, Interner)
+        self._iid = interner(self._full_name)
 
     def get_full_name(self): return self._full_name
 
-    def __eq__(self, other): return isinstance(other, DataType) and self.get_full_name()==other.get_full_name()
-    def __hash__(self): return self._hash_code
+    @property
+    def iid(self)->int: return self._iid
+
+    def __eq__(self, other): return isinstance(other, DataType) and self._iid==other._iid and self._interner is other._interner
+    def __hash__(self): return self._iid
 
     def __str__(self): return self.get_full_name()
 
@@ -41,7 +46,7 @@ class DataType:
 class DataTypeSymbol(Symbol, DataType):
     def __init__(self, name:str, scope:Scope):
         Symbol.__init__(self, name, scope)
-        DataType.__init__(self, Symbol.get_full_name(self))
+        DataType.__init__(self, Symbol.get_full_name(self), scope.interner)
 
     @staticmethod
     def scoped_creator(name:str):
@@ -61,7 +66,7 @@ class StaticArrayType(DataType):
     def __init__(self, element_type:DataType, length:int):
         self._element_type = ensure_type(element_type, DataType)
         self._length = ensure_type(length, int)
-        DataType.__init__(self, f"{self.element_type}[{self.length}]")
+        DataType.__init__(self, f"{self.element_type}[{self.length}]", element_type._interner)
 
     @property
     def element_type(self): return self._element_type
@@ -72,7 +77,7 @@ class StaticArrayType(DataType):
 class PointerType(DataType):
     def __init__(self, element_type:DataType):
         self._element_type = ensure_type(element_type, DataType)
-        DataType.__init__(self, f"{self.element_type}*")
+        DataType.__init__(self, f"{self.element_type}*", element_type._interner)
 
     @property
     def element_type(self): return self._element_type
@@ -81,7 +86,7 @@ class PointerType(DataType):
 class TaskType(DataType):
     def __init__(self, result_type:DataType):
         self._result_type = ensure_type(result_type, DataType)
-        DataType.__init__(self, f"task<{self.result_type}>")
+        DataType.__init__(self, f"task<{self.result_type}>", result_type._interner)
 
     @property
     def result_type(self): return self._result_type
@@ -184,7 +189,8 @@ class FunctionOverload:
         self._func_symbol = func_symbol
         self._params = ensure_type(params, list)
         self._return_type = ensure_type(return_type, DataType)
-        self._hash_code = sum(map(lambda p:hash(p.data_type), self.params)) + hash(self.return_type)
+        # overloads of different functions with the same signature must not collide (e.g. extern bindings)
+        self._hash_code = hash((func_symbol.iid, self.return_type.iid, *[p.data_type.iid for p in self.params]))
         self._implementation = None
         self._is_multiframe = ensure_type(is_multiframe, bool)
         self._is_extern = ensure_type(is_extern, bool)
@@ -244,6 +250,7 @@ class Function(Symbol):
         if overload in self.overloads:
             raise SymbolException(f"Function overload already exists: {overload}")
         self.overloads.add(overload)
+        if self.scope.journal is not None: self.scope.journal.added(self.overloads, overload)
         return overload
 
     def get_overloads_count(self): return len(self.overloads)
@@ -43,10 +43,23 @@ Usage:
         # Get the length of the longest prefix that leads to a final state:
         r = fa.find_longest_accepted_sequence_length("123abc") # 4
         r = fa.find_longest_accepted_sequence_length("a99") # -1
+
+    - Build a whole expression as an epsilon-NFA, then determinize and minimize it once:
+        nfa = EpsilonNFA()
+        q0, q1 = nfa.new_state(), nfa.new_state()
+        nfa.add_transition(q0, Charset.digits(), q1)
+        nfa.add_epsilon(q1, q0)
+        fa = nfa.to_minimal_dfa(q0, [q1]) # digits+
+
+    - Stepping through a deterministic automaton uses a compiled transitions table
+      (binary search over range boundaries, direct lookup for ASCII characters):
+        table = fa.compile() # built once, reused by the sequence checks above
+        q1 = table.next_state(fa.initial_state, 'a')
 """
 
 from __future__ import annotations
 import sys
+from bisect import bisect_right
 from collections import deque
 
 
@@ -304,64 +317,124 @@ class CharTransitionsSet:
                 yield q0, s, q1
 
     @staticmethod
-    def fix_disjoint_symbols_sets(transitions):
-        def get_or_create_list(dct, key):
-            if not key in dct: dct[key]=[]
-            return dct[key]
+    def sweep_ranges(ranges:list[tuple[int, int, any]])->list[tuple[int, int, tuple]]:
+        """
+        Cuts the code points line at every (start, end, label) range endpoint, in one sorted pass.
+        Returns the elementary intervals covered by at least one range, with their covering labels.
+        """
+        events:dict[int, list[tuple[bool, any]]] = {}
+        for start, end, label in ranges:
+            events.setdefault(start, []).append((True, label))
+            events.setdefault(end+1, []).append((False, label))
 
-        def get_many(dct, keys):
-            result = []
-            for k in keys: result.append(dct[k])
-            return result
+        result = []
+        active:dict[any, int] = {}
+        points = sorted(events)
+        for j, p in enumerate(points):
+            for opening, label in events[p]:
+                if opening:
+                    active[label] = active.get(label, 0)+1
+                    continue
+                active[label]-=1
+                if active[label]==0: del active[label]
+            if len(active)>0 and j+1<len(points):
+                result.append((p, points[j+1]-1, tuple(active)))
+        return result
+
+    @staticmethod
+    def partition_charsets(charsets:list[Charset])->dict[Charset, list[Charset]]:
+        """
+        Splits the charsets into disjoint atomic classes (characters belonging to exactly the same charsets).
+        Returns the atoms of each charset; atoms shared by several charsets are the same object.
+        """
+        sets, _ = CharTransitionsSet.gather_sets(charsets)
+        ranges = [(rng.start, rng.end, i) for i, cs in enumerate(sets) for rng in cs.ranges]
+
+        atom_ranges:dict[frozenset[int], list[CharsRange]] = {}
+        for start, end, labels in CharTransitionsSet.sweep_ranges(ranges):
+            atom_ranges.setdefault(frozenset(labels), []).append(CharsRange(start, end))
 
-        def enum_flatten(l): return [it for lst in l for it in lst]
-
-        symbols = map(lambda t:t[1], transitions.keys())
-        sets, index_set = CharTransitionsSet.gather_sets(symbols)
-        if len(index_set)==0: return transitions
-
-        partitions_list = [sets[0]]
-        partition_indices:list[list[int]] = [None] * len(sets)
-        partition_indices[0] = [0]
-        reunion = sets[0]
-
-        for i in range(1, len(sets)):
-            part_ix:dict[int, list[int]] = {}
-            new_partitions_list:list[Charset] = []
-            partition_indices[i] = []
-
-            for j, p in enumerate(partitions_list):
-                s = p * sets[i]
-                if not s.is_empty():
-                    new_partitions_list.append(s)
-                    get_or_create_list(part_ix, j).append(len(new_partitions_list)-1)
-                    partition_indices[i].append(len(new_partitions_list)-1)
-                s = p - sets[i]
-                if not s.is_empty():
-                    new_partitions_list.append(s)
-                    get_or_create_list(part_ix, j).append(len(new_partitions_list)-1)
-            s = sets[i] - reunion
-            if not s.is_empty():
-                new_partitions_list.append(s)
-                partition_indices[i].append(len(new_partitions_list)-1)
-            reunion = reunion + sets[i]
-            for k in range(0,i):
-                l = l0 = get_many(part_ix, partition_indices[k])
-                l = list(enum_flatten(l))
-                partition_indices[k] = l
-            partitions_list = new_partitions_list
+        result = {cs:[] for cs in sets}
+        for signature, rngs in atom_ranges.items():
+            atom = Charset(rngs)
+            for i in signature: result[sets[i]].append(atom)
+        return result
+
+    @staticmethod
+    def fix_disjoint_symbols_sets(transitions):
+        atoms = CharTransitionsSet.partition_charsets(map(lambda t:t[1], transitions.keys()))
         new_transitions = {}
         for q0, s, q1 in CharTransitionsSet._enumerate_transitions(transitions):
-            for part in get_many(partitions_list, partition_indices[index_set[s]]):
-                get_or_create_list(new_transitions, (q0, part)).extend(q1)
+            for part in atoms[s]:
+                new_transitions.setdefault((q0, part), []).extend(q1)
         return new_transitions
 
+class CompiledTransitions:
+    """
+    Per-state lookup tables of a deterministic transitions set.
+
+    For each state, the outgoing ranges are flattened into a sorted boundaries array
+    (binary searched with the character code) and a dense table of the first
+    ASCII_SIZE code points, so that a step costs O(log ranges) or O(1).
+    """
+    ASCII_SIZE = 128
+
+    def __init__(self, intervals:dict[any, list[tuple[int, int, any]]]):
+        self._bounds:dict[any, list[int]] = {}
+        self._targets:dict[any, list[any]] = {}
+        self._ascii:dict[any, list[any]] = {}
+
+        for q, rngs in intervals.items():
+            bounds = []
+            targets = []
+            for start, end, q1 in sorted(rngs, key=lambda t:t[0]):
+                if len(bounds)>0 and bounds[-1]==start and targets[-1] is None:
+                    bounds.pop(); targets.pop()
+                elif len(bounds)>0 and bounds[-1]>start:
+                    raise ValueError(f"Overlapping transitions from state {q}")
+                bounds.append(start); targets.append(q1)
+                bounds.append(end+1); targets.append(None)
+            self._bounds[q] = bounds
+            self._targets[q] = targets
+
+            ascii_table = [None] * CompiledTransitions.ASCII_SIZE
+            for start, end, q1 in rngs:
+                for o in range(start, min(end+1, CompiledTransitions.ASCII_SIZE)):
+                    ascii_table[o] = q1
+            self._ascii[q] = ascii_table
+
+    bounds = property(lambda s:s._bounds)
+    targets = property(lambda s:s._targets)
+    ascii = property(lambda s:s._ascii)
+
+    @staticmethod
+    def of(transitions:CharTransitionsSet)->CompiledTransitions:
+        if not transitions.is_deterministic:
+            raise RuntimeError("Only deterministic transitions can be compiled")
+        intervals = {}
+        for q0, s, q1 in CharTransitionsSet._enumerate_each_transition(transitions.transitions):
+            for rng in s.ranges:
+                intervals.setdefault(q0, []).append((rng.start, rng.end, q1))
+        return CompiledTransitions(intervals)
+
+    def next_state(self, q:any, c:str)->any:
+        o = ord(c)
+        if o < CompiledTransitions.ASCII_SIZE:
+            table = self._ascii.get(q)
+            return table[o] if table is not None else None
+        bounds = self._bounds.get(q)
+        if bounds is None: return None
+        k = bisect_right(bounds, o) - 1
+        return self._targets[q][k] if k>=0 else None
+
 class TextFiniteAutomaton:
     def __init__(self, transitions:CharTransitionsSet|dict, initial_state:any, final_states:list):
         self._transitions = transitions if isinstance(transitions, CharTransitionsSet) else CharTransitionsSet(transitions)
         self._initial_state = initial_state
         self._final_states = list(set(final_states))
         self._is_deterministic = self.transitions.is_deterministic
+        self._compiled:CompiledTransitions|None = None
+        self._final_states_set = set(self._final_states)
 
     transitions = property(lambda s:s._transitions)
     initial_state = property(lambda s:s._initial_state)
@@ -382,40 +455,84 @@ class TextFiniteAutomaton:
         return list(set(r))
 
     def _get_next_state(self, q0:any, c:str)->any:
+        if self.is_deterministic:
+            return self.compile().next_state(q0, c)
         states = self._get_next_states(q0, c)
         return states[0] if len(states)>0 else None
 
+    def compile(self)->CompiledTransitions:
+        self._validate_sequence_processing()
+        if self._compiled is None:
+            self._compiled = CompiledTransitions.of(self.transitions)
+        return self._compiled
+
     def _validate_sequence_processing(self):
         if not self.is_deterministic:
             raise RuntimeError("Could not check a sequence against an NFA. Make the automaton deterministic first. Use the TextFiniteAutomaton.as_deterministic() method")
 
     def is_accepted_sequence(self, sequence:str)->bool:
-        self._validate_sequence_processing()
+        next_state = self.compile().next_state
         q = self.initial_state
         for c in sequence:
-            q = self._get_next_state(q, c)
+            q = next_state(q, c)
             if q is None: return False
-        return q in self.final_states
+        return q in self._final_states_set
 
     def find_longest_accepted_sequence_length(self, sequence:str, start_index:int=0)->int:
-        self._validate_sequence_processing()
+        next_state = self.compile().next_state
         if start_index<0:
             raise ValueError(f"Invalid access index {start_index}")
+        final_states = self._final_states_set
         q = self.initial_state
-        max_len = 0 if q in self.final_states else -1
+        max_len = 0 if q in final_states else -1
         steps = 0
 
         # print(f"Start {q}")
         i = start_index
         while i<len(sequence):
-            q = self._get_next_state(q, sequence[i])
+            q = next_state(q, sequence[i])
             # print(f"With {sequence[i]} --> {q}")
             if q is None: break
-            if q in self.final_states: max_len = i + 1 - start_index
+            if q in final_states: max_len = i + 1 - start_index
             steps+=1
             i+=1
         return max_len
 
+    def get_finite_language(self, max_words:int=256)->list[str]|None:
+        """All the accepted sequences, or None if there are infinitely many or more than max_words"""
+        outgoing:dict[any, list[tuple[Charset, any]]] = {}
+        for q0, s, q1 in CharTransitionsSet._enumerate_each_transition(self.transitions.transitions):
+            outgoing.setdefault(q0, []).append((s, q1))
+
+        # states that can still lead to a final state
+        productive = set(self.final_states)
+        changed = True
+        while changed:
+            changed = False
+            for q0, trs in outgoing.items():
+                if not q0 in productive and any(q1 in productive for _, q1 in trs):
+                    productive.add(q0)
+                    changed = True
+
+        words:list[str] = []
+        path = set()
+        def visit(q, prefix)->bool:
+            if q in path: return False # cycle
+            if q in self._final_states_set: words.append(prefix)
+            if len(words)>max_words: return False
+            path.add(q)
+            for s, q1 in outgoing.get(q, []):
+                if not q1 in productive: continue
+                if s.count>max_words: return False
+                for rng in s.ranges:
+                    for o in range(rng.start, rng.end+1):
+                        if not visit(q1, prefix+chr(o)): return False
+            path.remove(q)
+            return True
+
+        if not self.initial_state in productive: return []
+        return words if visit(self.initial_state, "") else None
+
     class AutomatonProps:
         def __init__(self, transitions = None, initial_state=None, final_states=None):
             if transitions is None: transitions = {}
@@ -718,4 +835,147 @@ class TextFiniteAutomaton:
                 for i in range(modifier):
                     res = res * self
                 return res
-            raise ValueError("Invalid modifier. Concatenate count must be non-negative")
\ No newline at end of file
+            raise ValueError("Invalid modifier. Concatenate count must be non-negative")
+
+class EpsilonNFA:
+    """
+    Nondeterministic automaton with epsilon moves over integer states.
+
+    Meant for Thompson-style construction of a whole expression, which is then turned
+    into a TextFiniteAutomaton by a single subset construction followed by Hopcroft
+    minimization (instead of determinizing after every combination step).
+    """
+    def __init__(self):
+        self._states_count = 0
+        self._transitions:dict[int, list[tuple[Charset, int]]] = {}
+        self._epsilon:dict[int, list[int]] = {}
+
+    states_count = property(lambda s:s._states_count)
+
+    def new_state(self)->int:
+        self._states_count+=1
+        return self._states_count-1
+
+    def add_transition(self, q0:int, symbols:Charset, q1:int):
+        self._transitions.setdefault(q0, []).append((symbols, q1))
+
+    def add_epsilon(self, q0:int, q1:int):
+        self._epsilon.setdefault(q0, []).append(q1)
+
+    def _epsilon_closure(self, states)->frozenset[int]:
+        result = set(states)
+        stack = list(states)
+        while len(stack)>0:
+            q = stack.pop()
+            for q1 in self._epsilon.get(q, []):
+                if not q1 in result:
+                    result.add(q1)
+                    stack.append(q1)
+        return frozenset(result)
+
+    def _subset_construction(self, initial_state:int, final_states:set[int]):
+        partition = CharTransitionsSet.partition_charsets(cs for trs in self._transitions.values() for cs, _ in trs)
+        atoms:list[Charset] = []
+        atom_ids:dict[int, int] = {}
+        for parts in partition.values():
+            for atom in parts:
+                if not id(atom) in atom_ids:
+                    atom_ids[id(atom)] = len(atoms)
+                    atoms.append(atom)
+
+        moves:dict[int, dict[int, list[int]]] = {}
+        for q0, trs in self._transitions.items():
+            m = moves.setdefault(q0, {})
+            for cs, q1 in trs:
+                for atom in partition[cs]:
+                    m.setdefault(atom_ids[id(atom)], []).append(q1)
+
+        start = self._epsilon_closure([initial_state])
+        ids = {start: 0}
+        queue = deque([start])
+        delta:list[dict[int, int]] = []
+        accepting:list[bool] = []
+        while len(queue)>0:
+            states = queue.popleft()
+            targets:dict[int, set[int]] = {}
+            for q in states:
+                for a, q1s in moves.get(q, {}).items():
+                    targets.setdefault(a, set()).update(q1s)
+            row = {}
+            for a, q1s in targets.items():
+                target = self._epsilon_closure(q1s)
+                if not target in ids:
+                    ids[target] = len(ids)
+                    queue.append(target)
+                row[a] = ids[target]
+            delta.append(row)
+            accepting.append(len(states.intersection(final_states))>0)
+        return atoms, delta, accepting
+
+    @staticmethod
+    def _hopcroft(atoms_count:int, delta:list[dict[int, int]], accepting:list[bool])->list[int]:
+        # Returns the equivalence class of each state. Index len(delta) is the dead
+        # state, used to make the transition function total.
+        dead = len(delta)
+        n = dead + 1
+        inverse:list[dict[int, list[int]]] = [{} for _ in range(atoms_count)]
+        for q in range(n):
+            row = delta[q] if q<dead else {}
+            for a in range(atoms_count):
+                inverse[a].setdefault(row.get(a, dead), []).append(q)
+
+        final_block = set(q for q in range(dead) if accepting[q])
+        other_block = set(range(n)) - final_block
+        blocks = [b for b in (final_block, other_block) if len(b)>0]
+        block_of = [0] * n
+        for i, b in enumerate(blocks):
+            for q in b: block_of[q] = i
+
+        worklist = set([min(range(len(blocks)), key=lambda i:len(blocks[i]))])
+        while len(worklist)>0:
+            splitter = set(blocks[worklist.pop()])
+            for a in range(atoms_count):
+                inv = inverse[a]
+                x = set(q0 for q1 in splitter for q0 in inv.get(q1, []))
+                if len(x)==0: continue
+                for b in set(block_of[q] for q in x):
+                    inside = blocks[b].intersection(x)
+                    if len(inside)==len(blocks[b]): continue
+                    outside = blocks[b] - inside
+                    blocks[b] = inside
+                    blocks.append(outside)
+                    nb = len(blocks)-1
+                    for q in outside: block_of[q] = nb
+                    if b in worklist or len(outside)<=len(inside):
+                        worklist.add(nb)
+                    else:
+                        worklist.add(b)
+        return block_of
+
+    def to_minimal_dfa(self, initial_state:int, final_states:list[int])->TextFiniteAutomaton:
+        atoms, delta, accepting = self._subset_construction(initial_state, set(final_states))
+        block_of = EpsilonNFA._hopcroft(len(atoms), delta, accepting)
+        dead_block = block_of[len(delta)]
+
+        ids:dict[int, int] = {}
+        def state_id(b):
+            if not b in ids: ids[b] = len(ids)
+            return ids[b]
+
+        state_id(block_of[0])
+        transitions:dict[tuple[int, Charset], list[int]] = {}
+        final:set[int] = set()
+        done = set()
+        for q, row in enumerate(delta):
+            b = block_of[q]
+            if b==dead_block or b in done: continue
+            done.add(b)
+            if accepting[q]: final.add(state_id(b))
+            by_target:dict[int, list[CharsRange]] = {}
+            for a, q1 in row.items():
+                b1 = block_of[q1]
+                if b1==dead_block: continue
+                by_target.setdefault(state_id(b1), []).extend(atoms[a].ranges)
+            for q1, rngs in by_target.items():
+                transitions[(state_id(b), Charset(rngs))] = [q1]
+        return TextFiniteAutomaton(CharTransitionsSet(transitions), 0, list(final))
@@ -1,4 +1,7 @@
 from __future__ import annotations
+import hashlib
+from functools import partial
+from types import BuiltinMethodType, FunctionType, MethodType, ModuleType
 
 PRINT_EPS = "ε"
 PRINT_LEFT_ARR = "←"
@@ -83,14 +86,19 @@ class Rule:
         self.lhs = lhs
         self.rhs = [r for r in rhs if r!=Epsilon()]
         self.__on_build = None
+        # build callback taking the children list, generated by RuleCallbackCompiler when possible
+        self.build_callback:callable[[list[any]], any] = self.process_match
         self.rule_id = -1
         self.precomputed_hash = hash((self.lhs, *self.rhs))
 
+    on_build_callback = property(lambda self: self.__on_build)
+
     def __repr__(self): return f"Rule<{self.lhs} {PRINT_LEFT_ARR} {' '.join(map(str, self.rhs))}>"
     def __str__(self): return f"{self.lhs} {PRINT_LEFT_ARR} {' '.join(map(str, self.rhs))}"
 
     def on_build(self, f:callable[[list[any]], any]):
         self.__on_build = f
+        self.build_callback = self.process_match
         return self
 
     def process_match(self, children):
@@ -105,9 +113,11 @@ class Rule:
     def __hash__(self): return self.precomputed_hash #hash((self.lhs, *self.rhs))
 
 class RuleCallback:
-    def __init__(self, fun:callable[[list[any]], any], name="callback"):
+    def __init__(self, fun:callable[[list[any]], any], name="callback", applied:tuple[RuleCallback, tuple]|None=None):
         self.__name = name
         self.__fun = fun
+        # (callback, params) when this callback applies another one to callbacks of the rule arguments
+        self.__applied = applied
 
     def __repr__(self): return f"RuleCallback[{self.__name}]"
 
@@ -121,7 +131,7 @@ class RuleCallback:
             def f(*args):
                 pms = [p.call(*args) if isinstance(p, RuleCallback) else p for p in params]
                 return self.__fun(*pms)
-            return RuleCallback(f, name="internal")
+            return RuleCallback(f, name="internal", applied=(self, params))
         if self.__fun is None: raise ValueError("Callback is None")
         return self.__fun(*args)
 
@@ -131,10 +141,29 @@ class RuleCallback:
 
     def __add__(self, other:any): return RuleCallbackSum()(self, other)
 
+    def inline(self, args:list[str], compiler:RuleCallbackCompiler)->str|None:
+        """Python expression of self.call() on the `args` expressions, None if it can not be generated"""
+        if self.__applied is None: return self.apply_source(args, compiler)
+        callback, params = self.__applied
+        values = [compiler.value(p, args) for p in params]
+        if None in values: return None
+        return callback.apply_source(values, compiler)
+
+    def apply_source(self, args:list[str], compiler:RuleCallbackCompiler)->str|None:
+        """Python expression of the wrapped function called on the `args` expressions"""
+        if self.__fun is None: return None
+        if isinstance(self.__fun, RuleCallback): return self.__fun.inline(args, compiler)
+        return f"{compiler.constant(self.__fun)}({', '.join(args)})"
+
 class RuleCallbackArg(RuleCallback):
     def __init__(self, index):
         def f(*args): return args[index]
         super(RuleCallbackArg, self).__init__(f, name="arg")
+        self.__index = index
+
+    def apply_source(self, args, compiler):
+        if not isinstance(self.__index, int) or not -len(args)<=self.__index<len(args): return None
+        return args[self.__index]
 
 class RuleCallbackSum(RuleCallback):
     def __init__(self, default_value=None):
@@ -144,12 +173,23 @@ class RuleCallbackSum(RuleCallback):
             for i in range(1, len(args)): s = s + args[i]
             return s
         super(RuleCallbackSum, self).__init__(f, name="sum")
+        self.__default_value = default_value
+
+    def apply_source(self, args, compiler):
+        if len(args)==0: return compiler.constant(self.__default_value)
+        return f"({' + '.join(args)})"
 
 class RuleCallbackListOf(RuleCallback):
     def __init__(self, *lst):
         def f(*x): return list(x)
         cb = RuleCallback(f, name="id")(*lst)
         super(RuleCallbackListOf, self).__init__(cb, name="listof")
+        self.__lst = lst
+
+    def apply_source(self, args, compiler):
+        values = [compiler.value(p, args) for p in self.__lst]
+        if None in values: return None
+        return f"[{', '.join(values)}]"
 
 class RuleCallbackCall(RuleCallback):
     def __init__(self, f, *lst):
@@ -160,6 +200,15 @@ class RuleCallbackCall(RuleCallback):
             return g
         #cb = RuleCallback(f, name="call")(*lst)
         super(RuleCallbackCall, self).__init__(do, name="call")
+        self.__f = f
+        self.__lst = lst
+
+    def apply_source(self, args, compiler):
+        if self.__f is None: return None
+        fun = compiler.value(self.__f, args)
+        values = [compiler.value(p, args) for p in self.__lst]
+        if fun is None or None in values: return None
+        return f"{fun}({', '.join(values)})"
 
 class RuleCallbackSelect(RuleCallback):
     def __init__(self, source, f):
@@ -169,23 +218,141 @@ class RuleCallbackSelect(RuleCallback):
         def do(*args):
             return f(solve(source, args))
         super(RuleCallbackSelect, self).__init__(do, name="select")
+        self.__source = source
+        self.__f = f
+
+    def apply_source(self, args, compiler):
+        source = compiler.value(self.__source, args)
+        if source is None: return None
+        return f"{compiler.constant(self.__f)}({source})"
 
 class RuleCallbackSwitch(RuleCallback):
     def __init__(self, query, values:list[tuple[any, any]]):
         def solve(expr, args):
             if isinstance(expr, RuleCallback): return expr(*args)
             return expr
+        def fail(it): raise RuntimeError(f"RuleCallback Switch failed: {it} in {values}")
         def f(*args):
             it = solve(query, args)
             v = []
             for x,y in values:
                 if solve(x,args) == it: return solve(y, args)
-            raise RuntimeError(f"RuleCallback Switch failed: {it} in {values}")
+            fail(it)
         super(RuleCallbackSwitch, self).__init__(f, name="switch")
+        self.__query = query
+        self.__values = values
+        self.__fail = fail
+
+    def apply_source(self, args, compiler):
+        query = compiler.value(self.__query, args)
+        if query is None: return None
+        it = compiler.temporary()
+        result = f"{compiler.constant(self.__fail)}({it})"
+        for x, y in reversed(self.__values):
+            x, y = compiler.value(x, args), compiler.value(y, args)
+            if x is None or y is None: return None
+            result = f"{y} if {x} == {it} else {result}"
+        return f"({it} := {query}, {result})[1]"
 
 class RuleCallbackNoCall(RuleCallback):
     def __init__(self, val):
         super(RuleCallbackNoCall, self).__init__(lambda *args:val, name="nocall")
+        self.__val = val
+
+    def apply_source(self, args, compiler): return compiler.constant(self.__val)
+
+class RuleCallbackCompiler:
+    """
+    Generates one flat Python function per rule from its on_build callback, so that a reduction
+    is a single call instead of a walk through the nested RuleCallback closures:
+        rc.call(f, rc.arg(0), rc.arg(2))  =>  def _rule_3(c): a0, a1, a2 = c; return _k0(a0, a2)
+    Objects used by the callbacks (functions, constants) are bound as globals of the generated code,
+    except the methods of `owner`, looked up on the `_owner` global so that bind() can change it.
+    Any other object holding the owner is rejected, since bind() could not replace it.
+    Callbacks that can not be generated are called as they are.
+    """
+    LITERAL_TYPES = (type(None), bool, int, float, str)
+
+    def __init__(self, owner:any=None):
+        self.owner = owner
+        self.constants:dict[str, any] = {}
+        self.__names:dict[int, str] = {}
+        self.__temporaries = 0
+        self.__namespace:dict[str, any]|None = None
+
+    def holds_owner(self, value:any, seen:set[int]|None=None)->bool:
+        """Whether `value` references the owner: bound to it, or through its closure, defaults or attributes"""
+        if value is self.owner: return True
+        if type(value) in RuleCallbackCompiler.LITERAL_TYPES or isinstance(value, (type, ModuleType)): return False
+        seen = seen if seen is not None else set()
+        if id(value) in seen: return False
+        seen.add(id(value))
+        if isinstance(value, MethodType): refs = [value.__self__, value.__func__]
+        elif isinstance(value, BuiltinMethodType): refs = [value.__self__]
+        elif isinstance(value, FunctionType):
+            refs = list(value.__defaults__ or ()) + list((value.__kwdefaults__ or {}).values())
+            for cell in value.__closure__ or ():
+                try: refs.append(cell.cell_contents)
+                except ValueError: pass # empty cell
+        elif isinstance(value, (list, tuple, set, frozenset)): refs = list(value)
+        elif isinstance(value, dict): refs = list(value.values())
+        elif isinstance(value, partial): refs = [value.func, *value.args, *value.keywords.values()]
+        else: refs = list(getattr(value, '__dict__', {}).values())
+        return any(self.holds_owner(ref, seen) for ref in refs)
+
+    def constant(self, value:any)->str:
+        if type(value) in RuleCallbackCompiler.LITERAL_TYPES: return repr(value)
+        if self.owner is not None:
+            if value is self.owner: return "_owner"
+            if isinstance(value, MethodType) and value.__self__ is self.owner \
+                    and getattr(getattr(type(self.owner), value.__name__, None), '__code__', None) is value.__func__.__code__:
+                return f"_owner.{value.__name__}"
+            if self.holds_owner(value):
+                raise RuntimeError(f"Rule callback constant {value!r} holds the owner otherwise than through its methods, "
+                    "the callbacks could not be bound to another owner")
+        name = self.__names.get(id(value))
+        if name is None:
+            name = f"_k{len(self.constants)}"
+            self.__names[id(value)] = name
+            self.constants[name] = value
+        return name
+
+    def temporary(self)->str:
+        self.__temporaries += 1
+        return f"_t{self.__temporaries}"
+
+    def value(self, item:any, args:list[str])->str|None:
+        """Expression of a callback parameter: a RuleCallback evaluated on the rule arguments, or a constant"""
+        if isinstance(item, RuleCallback): return item.inline(args, self)
+        return self.constant(item)
+
+    def function_source(self, name:str, rule:Rule)->str:
+        args = [f"a{i}" for i in range(len(rule.rhs))]
+        callback = rule.on_build_callback
+        body = callback.inline(args, self) if isinstance(callback, RuleCallback) else None
+        if body is None:
+            body = f"{self.constant(callback)}({', '.join(args)})"
+        unpack = f"    {', '.join(args)}{',' if len(args)==1 else ''} = c\n" if len(args)>0 else ""
+        return f"def {name}(c):\n{unpack}    return {body}\n"
+
+    def compile(self, rules:list[Rule]):
+        """Sets the build_callback of the rules that have an on_build callback"""
+        rules = [r for r in rules if r.on_build_callback is not None]
+        names = [f"_rule_{i}" for i in range(len(rules))]
+        source = "\n".join(self.function_source(name, rule) for name, rule in zip(names, rules))
+        namespace = dict(self.constants, _owner=self.owner)
+        exec(compile(source, "<rule callbacks>", "exec"), namespace)
+        for name, rule in zip(names, rules):
+            rule.build_callback = namespace[name]
+        self.__namespace = namespace
+
+    def bind(self, rules:list[Rule], owner:any)->list[callable]:
+        """Build callbacks of the compiled rules calling the methods of `owner` instead of the compiled owner"""
+        namespace = dict(self.__namespace, _owner=owner)
+        def rebind(f):
+            if not isinstance(f, FunctionType) or f.__globals__ is not self.__namespace: return f
+            return FunctionType(f.__code__, namespace, f.__name__)
+        return [rebind(r.build_callback) for r in rules]
 
 class Namespace(object): pass
 
@@ -221,6 +388,7 @@ class Prediction1:
     def __init__(self, value, is_value, is_end_of_word, is_empty):
         self.value = value; self.is_value=is_value
         self.is_end_of_word = is_end_of_word; self.is_empty=is_empty
+        self.precomputed_hash = hash((value, is_value, is_end_of_word, is_empty))
 
     @staticmethod
     def of(value:Terminal|any):
@@ -246,19 +414,21 @@ class Prediction1:
             and self.is_end_of_word == other.is_end_of_word \
             and self.is_empty == other.is_empty
 
-    def __hash__(self):
-        return hash((self.value, self.is_value, self.is_end_of_word, self.is_empty))
+    def __hash__(self): return self.precomputed_hash
 
 class Prediction1Constants:
     end_of_word = Prediction1(None, False, True, False)
     empty = Prediction1(None, False, False, True)
 
 class Grammar:
-    def __init__(self, rules: list[Rule], start_symbol: NonTerminal|None = None):
+    def __init__(self, rules: list[Rule], start_symbol: NonTerminal|None = None, owner:any=None):
+        """owner: object whose methods the rule callbacks call, see bind_callbacks()"""
         assert len(rules)>0, "Grammar must contain at least one rule"
         self.rules = rules
         for i in range(len(self.rules)):
             self.rules[i].rule_id = i
+        self.__callbacks = RuleCallbackCompiler(owner)
+        self.__callbacks.compile(self.rules)
 
         self.start_symbol = start_symbol if start_symbol is not None else rules[0].lhs
         assert any(map(lambda r:r.lhs==self.start_symbol, rules)), "Start symbol must be defined by a rule"
@@ -283,82 +453,116 @@ class Grammar:
 
         self._cached_derivations:dict[NonTerminal, list[Rule]] = {}
 
-        self.first1_table: dict[NonTerminal, set[Prediction1]] = {}
-        self.__build_first1_table__()
-
-        self.follow1_table: dict[NonTerminal, set[Prediction1]] = {}
-        self.__build_follow1_table__()
-
+        # dense indices: predictions are bits of ints, terminals first, then $ and the empty word
+        self.terminal_index:dict[Terminal, int] = {t: i for i, t in enumerate(self.terminals)}
+        self.non_terminal_index:dict[NonTerminal, int] = {A: i for i, A in enumerate(self.non_terminals)}
+        self.end_bit = 1 << len(self.terminals)
+        self.empty_bit = self.end_bit << 1
+        self.__bit_predictions:list[Prediction1] = [Prediction1.of(t) for t in self.terminals] \
+            + [Prediction1.end_of_word(), Prediction1.empty()]
+
+        # only needed to build parse tables, computed on first use
+        self.__first1_bits:list[int]|None = None
+        self.__follow1_bits:list[int]|None = None
+        self.__first1_table: dict[NonTerminal, set[Prediction1]]|None = None
+        self.__follow1_table: dict[NonTerminal, set[Prediction1]]|None = None
+
+    first1_bits = property(lambda self: self.__first1_bits if self.__first1_bits is not None else self.__build_first1_bits())
+    follow1_bits = property(lambda self: self.__follow1_bits if self.__follow1_bits is not None else self.__build_follow1_bits())
+
+    first1_table = property(lambda self: self.__first1_table if self.__first1_table is not None else self.__build_first1_table__())
+    follow1_table = property(lambda self: self.__follow1_table if self.__follow1_table is not None else self.__build_follow1_table__())
+
+    def bind_callbacks(self, owner:any)->list[callable]:
+        """Build callbacks of the rules (by rule_id) for another owner, e.g. to share the grammar between instances"""
+        return self.__callbacks.bind(self.rules, owner)
+
+    def predictions_of_bits(self, bits:int)->list[Prediction1]:
+        result = []
+        predictions = self.__bit_predictions
+        while bits:
+            low = bits & -bits
+            result.append(predictions[low.bit_length()-1])
+            bits ^= low
+        return result
+
+    def first1_sequence_bits(self, components:list[RuleComponent])->int:
+        """FIRST of a sequence as bits (empty_bit if it derives the empty word)"""
+        first = self.first1_bits
+        result = 0
+        for comp in components:
+            if isinstance(comp, Terminal): return result | (1 << self.terminal_index[comp])
+            if isinstance(comp, NonTerminal):
+                f1 = first[self.non_terminal_index[comp]]
+                result |= f1 & ~self.empty_bit
+                if not f1 & self.empty_bit: return result
+        return result | self.empty_bit
+
+    def __build_first1_bits(self)->list[int]:
+        """FIRST of the nonterminals: only the rules using a nonterminal whose FIRST grew are evaluated again"""
+        first = self.__first1_bits = [0] * len(self.non_terminals)
+        users:list[set[Rule]] = [set() for _ in self.non_terminals]
+        for rule in self.rules:
+            for comp in rule.rhs:
+                if isinstance(comp, NonTerminal): users[self.non_terminal_index[comp]].add(rule)
+        worklist = list(reversed(self.rules))
+        queued = set(worklist)
+        while len(worklist)>0:
+            rule = worklist.pop()
+            queued.discard(rule)
+            A = self.non_terminal_index[rule.lhs]
+            f1 = first[A] | self.first1_sequence_bits(rule.rhs)
+            if f1==first[A]: continue
+            first[A] = f1
+            for user in users[A]:
+                if not user in queued:
+                    queued.add(user)
+                    worklist.append(user)
+        return first
+
+    def __build_follow1_bits(self)->list[int]:
+        """
+        FOLLOW of the nonterminals. The FIRST parts are added once, then FOLLOW(A) is propagated
+        to the B of the rules A -> alpha B beta with a nullable beta, only from the sets that grew.
+        """
+        follow = [0] * len(self.non_terminals)
+        follow[self.non_terminal_index[self.start_symbol]] = self.end_bit
+        flows_to:list[set[int]] = [set() for _ in self.non_terminals]
+        for rule in self.rules:
+            A = self.non_terminal_index[rule.lhs]
+            for i in range(len(rule.rhs)):
+                if not isinstance(rule.rhs[i], NonTerminal): continue
+                B = self.non_terminal_index[rule.rhs[i]]
+                first_beta = self.first1_sequence_bits(rule.rhs[i+1:])
+                follow[B] |= first_beta & ~self.empty_bit
+                if first_beta & self.empty_bit and A!=B: flows_to[A].add(B)
+        worklist = list(range(len(follow)))
+        queued = set(worklist)
+        while len(worklist)>0:
+            A = worklist.pop()
+            queued.discard(A)
+            for B in flows_to[A]:
+                f1 = follow[B] | follow[A]
+                if f1==follow[B]: continue
+                follow[B] = f1
+                if not B in queued:
+                    queued.add(B)
+                    worklist.append(B)
+        self.__follow1_bits = follow
+        return follow
 
     def __build_first1_table__(self):
-        self.first1_table.clear()
-        for A in self.non_terminals:
-            rules = self.get_derivations_of(A)
-            self.first1_table[A] = IterQuery(rules) \
-                .filter(lambda r:len(r.rhs)>0) \
-                .map(lambda r:r.rhs[0]) \
-                .filter(lambda c:isinstance(c, Terminal)) \
-                .map(Prediction1.of) \
-                .to_set()
-            if any(map(lambda r:len(r.rhs)==0, rules)):
-                self.first1_table[A].add(Prediction1.empty())
-
-        running=True
-        while running:
-            new_table:dict[NonTerminal, set[Prediction1]] = {}
-            for A in self.non_terminals:
-                new_table[A] = set()
-            for r in self.rules:
-                for f1 in self._first1_sequence_(r.rhs):
-                    new_table[r.lhs].add(f1)
-            running = False
-            for A in self.non_terminals:
-                if len(self.first1_table[A])!=len(new_table[A]):
-                    running=True
-                    break
-            self.first1_table = new_table
+        first = self.first1_bits
+        self.__first1_table = {A: set(self.predictions_of_bits(first[i])) for A, i in self.non_terminal_index.items()}
+        return self.__first1_table
 
     def _first1_sequence_(self, components: list[RuleComponent])->list[Prediction1]:
-        S: set[Prediction1] = set()
-        for comp in components:
-            if isinstance(comp, Terminal):
-                S.add(Prediction1.of(comp))
-                return list(S)
-            if isinstance(comp, NonTerminal):
-                f1 = self.first1_table[comp]
-                for c in f1:
-                    if not c.is_empty:
-                        S.add(c)
-                if not Prediction1.empty() in f1:
-                    return list(S)
-        S.add(Prediction1.empty())
-        return list(S)
+        return self.predictions_of_bits(self.first1_sequence_bits(components))
 
     def __build_follow1_table__(self):
-        for A in self.non_terminals:
-            self.follow1_table[A] = set()
-        self.follow1_table[self.start_symbol].add(Prediction1.end_of_word())
-        newly_added = 1
-        while newly_added>0:
-            newly_added = 0
-            for rule in self.rules:
-                A = rule.lhs
-                for i in range(len(rule.rhs)):
-                    if isinstance(rule.rhs[i], NonTerminal):
-                        B = rule.rhs[i]
-                        beta = rule.rhs[i+1:]
-                        first1Beta = self._first1_sequence_(beta)
-                        for p in first1Beta:
-                            if p.is_empty: continue
-                            if not p in self.follow1_table[B]:
-                                newly_added+=1
-                                self.follow1_table[B].add(p)
-                        if Prediction1.empty() in first1Beta:
-                            for p in self.follow1_table[A]:
-                                if not p in self.follow1_table[B]:
-                                    newly_added+=1
-                                    self.follow1_table[B].add(p)
-
+        follow = self.follow1_bits
+        self.__follow1_table = {A: set(self.predictions_of_bits(follow[i])) for A, i in self.non_terminal_index.items()}
+        return self.__follow1_table
 
     def get_derivations_of(self, n:NonTerminal):
         if not n in self._cached_derivations:
@@ -376,6 +580,14 @@ class Grammar:
 
         return cs
 
+    def fingerprint(self)->str:
+        """sha256 of the start symbol and the rules, changes with any renamed or reordered symbol"""
+        h = hashlib.sha256(f"start {self.start_symbol.name}\n".encode())
+        for rule in self.rules:
+            rhs = ' '.join(f"t:{c.value!r}" if isinstance(c, Terminal) else f"n:{c.name}" for c in rule.rhs)
+            h.update(f"{rule.lhs.name} -> {rhs}\n".encode())
+        return h.hexdigest()
+
     def get_terminal_by_value(self, value, comp=None):
         comp = comp or (lambda x,y: x==y)
         candidates = [t for t in self.terminals if comp(t.value, value)]
@@ -1,12 +1,98 @@
 from __future__ import annotations
-from fa import Charset, TextFiniteAutomaton
+from array import array
+from bisect import bisect_right
+from collections import deque
+import hashlib, json
+from fa import Charset, CharTransitionsSet, TextFiniteAutomaton, CompiledTransitions, EpsilonNFA
+from utils import atomic_write
+import lexer_codegen
+
+class RegexAutomataBuilder:
+    """
+    Builds a regex automaton by combining TextFiniteAutomaton objects at every step
+    (each combination produces a new deterministic automaton)
+    """
+    def is_expression(self, e)->bool: return isinstance(e, TextFiniteAutomaton)
+    def charset(self, charset:Charset)->TextFiniteAutomaton:
+        return TextFiniteAutomaton({('Q0', charset):['Q1']}, 'Q0', ['Q1'])
+    def empty(self)->TextFiniteAutomaton: return TextFiniteAutomaton.empty()
+    def concat(self, e1, e2)->TextFiniteAutomaton: return e1 * e2
+    def union(self, e1, e2)->TextFiniteAutomaton: return e1 + e2
+    def repeat(self, e, modifier:str)->TextFiniteAutomaton: return e ^ modifier
+    def build(self, e)->TextFiniteAutomaton: return e
+
+class ThompsonRegexBuilder:
+    """
+    Builds a regex automaton as epsilon-NFA fragments (Thompson construction),
+    determinized and minimized only once, when the whole expression is parsed
+    """
+    class Fragment:
+        __slots__ = ('start', 'end')
+        def __init__(self, start:int, end:int): self.start = start; self.end = end
+        def __repr__(self): return f"<Fragment {self.start}->{self.end}>"
+
+    def __init__(self):
+        self.nfa = EpsilonNFA()
+
+    def is_expression(self, e)->bool: return isinstance(e, ThompsonRegexBuilder.Fragment)
+
+    def charset(self, charset:Charset)->ThompsonRegexBuilder.Fragment:
+        f = ThompsonRegexBuilder.Fragment(self.nfa.new_state(), self.nfa.new_state())
+        self.nfa.add_transition(f.start, charset, f.end)
+        return f
+
+    def empty(self)->ThompsonRegexBuilder.Fragment:
+        q = self.nfa.new_state()
+        return ThompsonRegexBuilder.Fragment(q, q)
+
+    def concat(self, e1, e2)->ThompsonRegexBuilder.Fragment:
+        self.nfa.add_epsilon(e1.end, e2.start)
+        return ThompsonRegexBuilder.Fragment(e1.start, e2.end)
+
+    def union(self, e1, e2)->ThompsonRegexBuilder.Fragment:
+        f = ThompsonRegexBuilder.Fragment(self.nfa.new_state(), self.nfa.new_state())
+        for e in (e1, e2):
+            self.nfa.add_epsilon(f.start, e.start)
+            self.nfa.add_epsilon(e.end, f.end)
+        return f
+
+    def repeat(self, e, modifier:str)->ThompsonRegexBuilder.Fragment:
+        if modifier!='*' and modifier!='+':
+            raise ValueError("Invalid modifier. Must be '*' or '+'.")
+        f = ThompsonRegexBuilder.Fragment(self.nfa.new_state(), self.nfa.new_state())
+        self.nfa.add_epsilon(f.start, e.start)
+        self.nfa.add_epsilon(e.end, e.start)
+        self.nfa.add_epsilon(e.end, f.end)
+        if modifier=='*': self.nfa.add_epsilon(f.start, f.end)
+        return f
+
+    def build(self, e)->TextFiniteAutomaton:
+        return self.nfa.to_minimal_dfa(e.start, [e.end])
 
 class RegularExpression:
-    def __init__(self, regex):
-        self.fa = RegularExpression.parse_regex(regex)
+    BUILDERS = {
+        'thompson': ThompsonRegexBuilder,
+        'combine': RegexAutomataBuilder,
+    }
+
+    def __init__(self, regex, method='thompson'):
+        if not method in RegularExpression.BUILDERS:
+            raise ValueError(f"Unknown regex compile method: {method}")
+        self.regex = regex
+        self.method = method
+        self._fa = None
+
+    def get_fa(self)->TextFiniteAutomaton:
+        if self._fa is None:
+            builder = RegularExpression.BUILDERS[self.method]()
+            self._fa = RegularExpression.parse_regex(self.regex, builder)
+        return self._fa
+
+    fa = property(get_fa)
 
     @staticmethod
-    def parse_regex(regex) -> RegularExpression:
+    def parse_regex(regex, builder=None) -> TextFiniteAutomaton:
+        if builder is None: builder = RegexAutomataBuilder()
         class LeftBracket:
             def __repr__(self): return "<LeftBracket>"
         class Escape:
@@ -73,7 +159,7 @@ class RegularExpression:
                             charset = charset+Charset.single_char(r.char)
                         elif r==compl: negate = True
                     if negate: charset = ~charset
-                    stack.append(TextFiniteAutomaton({('Q0', charset):["Q1"]}, "Q0", ["Q1"]))
+                    stack.append(builder.charset(charset))
                     return False
                 if c=='^' and is_last_on_stack(lambda _:_==leftBracket):
                     stack.append(compl)
@@ -93,31 +179,31 @@ class RegularExpression:
             if isinstance(c, str):
                 if is_last_on_stack(lambda _:_ == escape):
                     stack.pop()
-                    push_in_fa_ctx(TextFiniteAutomaton({('Q0', Charset.single_char(c)):['Q1']}, 'Q0', ['Q1']))
+                    push_in_fa_ctx(builder.charset(Charset.single_char(c)))
                     return
                 if c=='\\': stack.append(escape); return
                 if c=='*' or c=='+':
-                    if not is_last_on_stack(lambda _:isinstance(_, TextFiniteAutomaton)):
+                    if not is_last_on_stack(builder.is_expression):
                         raise ValueError(f"SyntaxError before '{c}': invalid expression")
                     fa = stack.pop()
-                    push_in_fa_ctx(fa^c)
+                    push_in_fa_ctx(builder.repeat(fa, c))
                     return
                 if c=='|': stack.append(faor); return
                 if c=='(': stack.append(leftParen); return
                 if c==')':
                     fas = pop_until(lambda _:_==leftParen)
-                    fa = TextFiniteAutomaton.empty()
-                    for a in fas: fa = fa * a
+                    fa = builder.empty()
+                    for a in fas: fa = builder.concat(fa, a)
                     push_in_fa_ctx(fa)
                     return
-                push_in_fa_ctx(TextFiniteAutomaton({('Q0', Charset.single_char(c)):['Q1']}, 'Q0', ['Q1']))
+                push_in_fa_ctx(builder.charset(Charset.single_char(c)))
                 return
-            if isinstance(c, TextFiniteAutomaton):
+            if builder.is_expression(c):
                 if is_last_on_stack(lambda _:_==faor):
                     d, _ = pop_last_two()
-                    if not isinstance(d, TextFiniteAutomaton):
+                    if not builder.is_expression(d):
                         raise RuntimeError(f"SyntaxError error: expected expression, got {type(d)}")
-                    push_in_fa_ctx(c + d)
+                    push_in_fa_ctx(builder.union(c, d))
                     return
                 stack.append(c)
 
@@ -127,7 +213,7 @@ class RegularExpression:
                 if c=='[':
                     if is_last_on_stack(lambda _:_==escape):
                         stack.pop()
-                        push_in_fa_ctx(TextFiniteAutomaton({('Q0', Charset.single_char(c)):['Q1']}, 'Q0', ['Q1']))
+                        push_in_fa_ctx(builder.charset(Charset.single_char(c)))
                     else:
                         stack.append(leftBracket)
                         charset_mode = True
@@ -137,19 +223,27 @@ class RegularExpression:
                 if not push_char_in_range(c): charset_mode = False
                 continue
 
-        fa = TextFiniteAutomaton.empty()
-        for a in stack: fa = fa * a
+        fa = builder.empty()
+        for a in stack: fa = builder.concat(fa, a)
+
+        return builder.build(fa)
 
-        return fa
+class LexicalError(Exception):
+    def __init__(self, message, row:int, col:int):
+        super().__init__(message)
+        self.row = row
+        self.col = col
 
 class LexicalToken:
+    __slots__ = ('_value', '_token_type', '_pos', '_row', '_col', '_props')
+
     def __init__(self, value, token_type, pos, row, col, props = None):
         self._value = value
         self._token_type = token_type
         self._pos = pos
         self._row = row
         self._col = col
-        self.props = props if props is not None else {}
+        self._props = props
 
     value = property(lambda s:s._value)
     token_type = property(lambda s:s._token_type)
@@ -157,17 +251,314 @@ class LexicalToken:
     row = property(lambda s:s._row)
     col = property(lambda s:s._col)
 
+    def get_props(self)->dict:
+        if self._props is None: self._props = {}
+        return self._props
+
+    def set_props(self, props:dict): self._props = props
+
+    props = property(get_props, set_props)
+
     def __repr__(self):
         return f"<{self.token_type}@{self.row}:{self.col} = {repr(self.value)}>"
 
+class TokenBuffer:
+    """
+    Columnar token stream: parallel arrays of rule index, start offset, length, row and col.
+    Token values are sliced from the text, and LexicalToken objects created, only when a token is accessed.
+    Built by tokenize() (and parse()) for callers that keep all the tokens; the parser streams them
+    from iter_tokens() instead, without a buffer.
+    """
+    def __init__(self, text:str, rules:list[tuple]):
+        self._text = text
+        self._rules = rules
+        self.rule_ids = array('i')
+        self.starts = array('i')
+        self.lengths = array('i')
+        self.rows = array('i')
+        self.cols = array('i')
+        self.error:str|None = None
+
+    text = property(lambda s:s._text)
+    success = property(lambda s:s.error is None)
+
+    def append(self, rule_index:int, start:int, length:int, row:int, col:int):
+        self.rule_ids.append(rule_index)
+        self.starts.append(start)
+        self.lengths.append(length)
+        self.rows.append(row)
+        self.cols.append(col)
+
+    def token_type(self, i:int)->str: return self._rules[self.rule_ids[i]][0]
+
+    def value(self, i:int)->str:
+        start = self.starts[i]
+        return self._text[start:start+self.lengths[i]]
+
+    def __len__(self): return len(self.rule_ids)
+
+    def __getitem__(self, i:int|slice)->LexicalToken|list[LexicalToken]:
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        token_type, _, props = self._rules[self.rule_ids[i]]
+        start = self.starts[i]
+        return LexicalToken(self._text[start:start+self.lengths[i]], token_type, start, self.rows[i], self.cols[i], props)
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
+
+    def __repr__(self): return repr(list(self))
+
+class CombinedLexerAutomaton:
+    """
+    Deterministic product of the lexer rules automata.
+
+    Each state is a tuple holding the current state of every rule automaton (None once
+    the rule can no longer match). A state accepts for the first rule (in declaration
+    order) whose component is final, so a single maximal-munch pass over the text gives
+    the same token as racing every rule separately.
+
+    Rules left out of the product (keywords, see Lexer.find_keywords) are recovered
+    through the `keywords` table: spelling -> rule index, checked for tokens matched by
+    one of the `keyword_hosts` rules.
+    """
+    FORMAT_VERSION = 2
+
+    def __init__(self, automata:list[TextFiniteAutomaton]|None, rule_ids:list[int]|None=None,
+            keywords:dict[str, int]|None=None, keyword_hosts:list[int]|None=None):
+        """rule_ids are the rule indices reported for the automata (their positions by default)"""
+        self._accepting_rule:list[int] = []
+        self._intervals:dict[int, list[tuple[int, int, int]]] = {}
+        self._keywords = keywords if keywords is not None else {}
+        self._keyword_hosts = sorted(keyword_hosts) if keyword_hosts is not None else []
+        self._keyword_hosts_set = set(self._keyword_hosts)
+        if automata is None: return
+        if rule_ids is None: rule_ids = list(range(len(automata)))
+
+        outgoing = [CombinedLexerAutomaton._index_outgoing(fa) for fa in automata]
+        final_states = [set(fa.final_states) for fa in automata]
+
+        def accepting_rule(key):
+            for i, q in enumerate(key):
+                if q is not None and q in final_states[i]: return rule_ids[i]
+            return -1
+
+        initial_key = tuple(fa.initial_state for fa in automata)
+        ids = {initial_key: 0}
+        intervals:dict[int, list[tuple[int, int, int]]] = {}
+        queue = deque([initial_key])
+        while len(queue)>0:
+            key = queue.popleft()
+            q = ids[key]
+            intervals[q] = []
+            for start, end, target_key in CombinedLexerAutomaton._step_intervals(key, outgoing):
+                if not target_key in ids:
+                    ids[target_key] = len(ids)
+                    queue.append(target_key)
+                intervals[q].append((start, end, ids[target_key]))
+            self._accepting_rule.append(accepting_rule(key))
+        self._intervals = intervals
+        self._table = CompiledTransitions(intervals)
+
+    states_count = property(lambda s: len(s._accepting_rule))
+    accepting_rule = property(lambda s: s._accepting_rule)
+    intervals = property(lambda s: s._intervals)
+    keywords = property(lambda s: s._keywords)
+    keyword_hosts = property(lambda s: s._keyword_hosts)
+
+    def save(self, path:str, key:str):
+        data = {
+            'version': CombinedLexerAutomaton.FORMAT_VERSION,
+            'key': key,
+            'accepting': self._accepting_rule,
+            'keywords': self._keywords,
+            'keyword_hosts': self._keyword_hosts,
+            'intervals': [[x for rng in self._intervals[q] for x in rng] for q in range(self.states_count)]
+        }
+        atomic_write(path, json.dumps(data, separators=(',', ':')))
+
+    @staticmethod
+    def load(path:str, key:str)->CombinedLexerAutomaton|None:
+        """Returns None if the file is missing, unreadable or was built for other rules"""
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version')!=CombinedLexerAutomaton.FORMAT_VERSION or data.get('key')!=key:
+            return None
+        automaton = CombinedLexerAutomaton(None, keywords=data['keywords'], keyword_hosts=data['keyword_hosts'])
+        automaton._accepting_rule = data['accepting']
+        automaton._intervals = {q: list(zip(flat[0::3], flat[1::3], flat[2::3])) for q, flat in enumerate(data['intervals'])}
+        automaton._table = CompiledTransitions(automaton._intervals)
+        return automaton
+
+    @staticmethod
+    def _index_outgoing(fa:TextFiniteAutomaton)->dict[any, list[tuple[int, int, any]]]:
+        result = {}
+        for (q0, symbols), q1s in fa.transitions.transitions.items():
+            for q1 in q1s:
+                for rng in symbols.ranges:
+                    result.setdefault(q0, []).append((rng.start, rng.end, q1))
+        return result
+
+    @staticmethod
+    def _step_intervals(key:tuple, outgoing:list[dict])->list[tuple[int, int, tuple]]:
+        # Sweeps the ranges leaving the component states, then computes the product
+        # target of each elementary interval
+        ranges = []
+        for i, q in enumerate(key):
+            if q is None: continue
+            for start, end, q1 in outgoing[i].get(q, []): ranges.append((start, end, (i, q1)))
+
+        result = []
+        for lo, hi, labels in CharTransitionsSet.sweep_ranges(ranges):
+            target = [None] * len(key)
+            for i, q1 in labels: target[i] = q1
+            target = tuple(target)
+            if len(result)>0 and result[-1][2]==target and result[-1][1]==lo-1:
+                result[-1] = (result[-1][0], hi, target)
+                continue
+            result.append((lo, hi, target))
+        return result
+
+    def match(self, text:str, index:int)->tuple[int, int]:
+        """Returns (length, rule index) of the longest token starting at `index`, or (-1, -1)"""
+        ascii_tables = self._table.ascii
+        next_state = self._table.next_state
+        ascii_size = CompiledTransitions.ASCII_SIZE
+        accepting = self._accepting_rule
+
+        q = 0
+        best_len, best_rule = (0, accepting[0]) if accepting[0]>=0 else (-1, -1)
+        i = index
+        n = len(text)
+        while i<n:
+            c = text[i]
+            o = ord(c)
+            q = ascii_tables[q][o] if o<ascii_size else next_state(q, c)
+            if q is None: break
+            i+=1
+            if accepting[q]>=0:
+                best_len = i - index
+                best_rule = accepting[q]
+        if best_rule in self._keyword_hosts_set:
+            k = self._keywords.get(text[index:index+best_len])
+            if k is not None and k<best_rule: best_rule = k
+        return best_len, best_rule
+
+class LineIndex:
+    """Start offsets of the lines of a text, built once to map indices to (row, col) in O(log lines)"""
+    def __init__(self, text:str):
+        self._line_starts = [0]
+        pos = 0
+        for line in text.splitlines(keepends=True):
+            pos += len(line)
+            self._line_starts.append(pos)
+
+    line_starts = property(lambda s:s._line_starts)
+
+    def coordinates(self, index:int)->tuple[int, int]:
+        """Same result as Lexer.index_to_coordinates(text, index)"""
+        row = bisect_right(self._line_starts, index)
+        return row, index - self._line_starts[row-1] + 1
+
 class Lexer:
-    def __init__(self):
+    # combined automata shared by all the lexers of the process, by rules key
+    _automata_cache:dict[str, CombinedLexerAutomaton] = {}
+
+    # keyword rules can spell at most this many sequences
+    KEYWORD_MAX_SPELLINGS = 16
+
+    def __init__(self, engine:str='dfa', cache_path:str|None=None, module_path:str|None=None, keyword_table:bool=False):
+        """
+        engine is one of: 'dfa' (all rules merged into one automaton), 'rules' (try rules one by one)
+        or 'codegen' (the merged automaton compiled to a generated Python module, see lexer_codegen)
+        cache_path is an optional file where the combined automaton is persisted between runs
+        module_path is an optional file where the generated module is persisted between runs
+        keyword_table: keyword rules are not matched by automata, but looked up by spelling
+        after matching the rule that also accepts them (see find_keywords)
+        """
+        if not engine in ('dfa', 'rules', 'codegen'):
+            raise ValueError(f"Invalid lexer engine: {engine}")
         self.rules = []
+        self.engine = engine
+        self.cache_path = cache_path
+        self.module_path = module_path
+        self.keyword_table = keyword_table
+        self._automaton:CombinedLexerAutomaton|None = None
+        self._module = None
+        self._keywords:tuple[dict[str, int], set[int]]|None = None
 
     def add_rule(self, token_name, regex, props=None):
         if isinstance(regex, str):
             regex = RegularExpression(regex)
         self.rules.append((token_name, regex, props))
+        self._automaton = None
+        self._module = None
+        self._keywords = None
+
+    def rules_key(self)->str:
+        h = hashlib.sha256(f"CombinedLexerAutomaton/{CombinedLexerAutomaton.FORMAT_VERSION}".encode())
+        for token_name, regex, _ in self.rules:
+            h.update(f"\0{token_name}\0{regex.regex}".encode())
+        if self.keyword_table: h.update(b"\0keyword_table")
+        return h.hexdigest()
+
+    def find_keywords(self)->tuple[dict[str, int], set[int]]:
+        """
+        Finds the rules with a small finite language whose every spelling is also accepted
+        by a later rule (e.g. KW_BEGIN and ID). Returns (rule index by spelling, host rules),
+        where hosts are the other rules accepting some of these spellings.
+
+        Matching without these rules, then replacing the rule of a host token by the keyword
+        rule of its spelling (when that one comes first) gives the same tokens.
+        """
+        if self._keywords is not None: return self._keywords
+        spellings:dict[int, list[str]] = {}
+        for i, rule in enumerate(self.rules):
+            words = rule[1].fa.get_finite_language(Lexer.KEYWORD_MAX_SPELLINGS)
+            if words is not None and len(words)>0 and all(len(w)>0 for w in words):
+                spellings[i] = words
+
+        keywords:dict[str, int] = {}
+        for i, words in spellings.items():
+            later = [rule[1].fa for j, rule in enumerate(self.rules) if j>i and not j in spellings]
+            if all(any(fa.is_accepted_sequence(w) for fa in later) for w in words):
+                for w in words: keywords.setdefault(w, i)
+
+        excluded = set(keywords.values())
+        hosts = set()
+        for j, rule in enumerate(self.rules):
+            if j in excluded: continue
+            if any(rule[1].fa.is_accepted_sequence(w) for w in keywords): hosts.add(j)
+        self._keywords = (keywords, hosts)
+        return self._keywords
+
+    def get_automaton(self)->CombinedLexerAutomaton:
+        if self._automaton is not None: return self._automaton
+
+        key = self.rules_key()
+        automaton = Lexer._automata_cache.get(key)
+        if automaton is None and self.cache_path is not None:
+            automaton = CombinedLexerAutomaton.load(self.cache_path, key)
+        if automaton is None:
+            keywords, hosts = self.find_keywords() if self.keyword_table else ({}, set())
+            rule_ids = [i for i in range(len(self.rules)) if not i in keywords.values()]
+            automaton = CombinedLexerAutomaton([self.rules[i][1].fa for i in rule_ids], rule_ids, keywords, hosts)
+            if self.cache_path is not None:
+                try:
+                    automaton.save(self.cache_path, key)
+                except OSError as e:
+                    print(f"Lexer: could not save automaton cache: {e}")
+        Lexer._automata_cache[key] = automaton
+        self._automaton = automaton
+        return automaton
+
+    def get_generated_module(self):
+        if self._module is None:
+            self._module = lexer_codegen.get_lexer_module(self.rules_key(), self.get_automaton, self.module_path)
+        return self._module
 
     @staticmethod
     def index_to_coordinates(s, index):
@@ -177,27 +568,117 @@ class Lexer:
         sp = s[:index+1].splitlines(keepends=True)
         return len(sp), len(sp[-1])
 
-    def parse(self, text):
+    def _match_rules(self, text, index)->tuple[int, int]:
+        keywords, hosts = self.find_keywords() if self.keyword_table else ({}, set())
+        excluded = keywords.values()
+        l = -1
+        rule_index = -1
+        for i, rule in enumerate(self.rules):
+            if i in excluded: continue
+            l0 = rule[1].fa.find_longest_accepted_sequence_length(text, index)
+            if l0>l:
+                l = l0
+                rule_index = i
+        if rule_index in hosts:
+            k = keywords.get(text[index:index+l])
+            if k is not None and k<rule_index: rule_index = k
+        return l, rule_index
+
+    def _iter_spans(self, text, start=0):
+        if self.engine=='codegen':
+            if start==0:
+                yield from self.get_generated_module().iter_lex(text)
+                return
+            for rule_index, index, l in self.get_generated_module().iter_lex(text[start:]):
+                yield rule_index, index+start, l
+            return
+        match = self.get_automaton().match if self.engine=='dfa' else self._match_rules
+        index = start
+        while index<len(text):
+            l, rule_index = match(text, index)
+            if l<=0: break
+            yield rule_index, index, l
+            index+=l
+
+    def _lex_spans(self, text)->tuple[list[tuple[int, int, int]], int]:
+        if self.engine=='codegen': return self.get_generated_module().lex(text)
+        match = self.get_automaton().match if self.engine=='dfa' else self._match_rules
+        spans = []
         index = 0
-        tokens = []
-        error = None
         while index<len(text):
-            l = -1
-            token_type = None
-            token_props = None
-            for rule in self.rules:
-                l0 = rule[1].fa.find_longest_accepted_sequence_length(text, index)
-                if l0>l:
-                    l = l0
-                    token_type = rule[0]
-                    token_props = rule[2]
-            coords = self.index_to_coordinates(text, index)
-            if l<=0:
-                error = f"Lexical error at {coords}: Invalid token"
-                break
-            tokens.append(LexicalToken(text[index:index+l], token_type, index, *coords, token_props))
+            l, rule_index = match(text, index)
+            if l<=0: break
+            spans.append((rule_index, index, l))
             index+=l
-        if error is None:
-            return {"tokens":tokens, "success":True}
-        return {"tokens":tokens, "success":False, "error":error}
+        return spans, index
+
+    def separation_error(self, token1:LexicalToken, token2:LexicalToken)->str:
+        return f"Lexical error at {(token2.row, token2.col)}: {token1.token_type} and {token2.token_type} must be separated"
+
+    def _scan_tokens(self, text, spans, skip=(), separated=(), start=0):
+        """
+        Yields (rule index, start, length, row, col) of the spans (an iterable of consecutive
+        (rule index, start, length) from `start`), leaving out the tokens of `skip` types. Raises a LexicalError
+        when reaching two adjacent tokens (skipped ones included) forming a `separated` (type1, type2)
+        pair, or the end of the spans before the end of the text.
+        """
+        names = [rule[0] for rule in self.rules]
+        skipped = set(i for i, name in enumerate(names) if name in skip)
+        separated = set(separated)
+        separated_ids = set((i, j) for i, a in enumerate(names) for j, b in enumerate(names) if (a, b) in separated)
 
+        line_index = LineIndex(text)
+        line_starts = line_index.line_starts
+        lines_count = len(line_starts)
+        row = 0
+        prev = (-1, start, 0)
+        for rule_index, index, l in spans:
+            while row<lines_count and line_starts[row]<=index: row+=1
+            col = index-line_starts[row-1]+1
+            if len(separated_ids)>0 and (prev[0], rule_index) in separated_ids:
+                prev_rule, prev_index, prev_l = prev
+                token1 = LexicalToken(text[prev_index:prev_index+prev_l], names[prev_rule], prev_index, *line_index.coordinates(prev_index))
+                token2 = LexicalToken(text[index:index+l], names[rule_index], index, row, col)
+                raise LexicalError(self.separation_error(token1, token2), row, col)
+            prev = (rule_index, index, l)
+            if rule_index in skipped: continue
+            yield rule_index, index, l, row, col
+        end = prev[1]+prev[2]
+        if end<len(text):
+            row, col = line_index.coordinates(end)
+            raise LexicalError(f"Lexical error at {(row, col)}: Invalid token", row, col)
+
+    def tokenize(self, text, skip=(), separated=())->TokenBuffer:
+        """
+        Lexes the whole text into a TokenBuffer (see _scan_tokens for skip and separated).
+        On errors, the buffer holds the tokens before the error and its message. As the whole
+        text is lexed first, an invalid token is reported before any separation error.
+        """
+        buffer = TokenBuffer(text, self.rules)
+        append = buffer.append
+        spans, end = self._lex_spans(text)
+        if end<len(text): separated = ()
+        try:
+            for token in self._scan_tokens(text, spans, skip, separated):
+                append(*token)
+        except LexicalError as e:
+            buffer.error = str(e)
+        return buffer
+
+    def iter_tokens(self, text, skip=(), separated=(), start=0):
+        """
+        Yields the LexicalToken objects while lexing the text from index `start`, which must be
+        the end of a token (see _scan_tokens for skip and separated).
+        Errors are raised as LexicalError when reached: unlike tokenize, the first error
+        of the text is raised, a separation error before a later invalid token.
+        """
+        rules = self.rules
+        for rule_index, index, l, row, col in self._scan_tokens(text, self._iter_spans(text, start), skip, separated, start):
+            token_type, _, props = rules[rule_index]
+            yield LexicalToken(text[index:index+l], token_type, index, row, col, props)
+
+    def parse(self, text):
+        tokens = Lexer.tokenize(self, text)
+        if tokens.success:
+            return {"tokens":list(tokens), "success":True}
+        return {"tokens":list(tokens), "success":False, "error":tokens.error}
@@ -0,0 +1,206 @@
+"""
+Python source code generator for combined lexer automata.
+
+The automaton states become rows of integers in a flat transitions tuple, indexed by
+character classes (codes that behave the same in every state). The generated iter_lex()
+translates the whole text to class codes first (str.translate), so that its loop
+only does tuple lookups and integer comparisons; lex() collects its tokens.
+
+Usage:
+    module = get_lexer_module(key, build_automaton, "lexer_gen.py")
+    spans, end = module.lex(text) # spans = [(rule_index, start, length), ...]
+    # end < len(text) if no rule matches at `end`
+    for rule_index, start, length in module.iter_lex(text): ... # stops where no rule matches
+"""
+
+from __future__ import annotations
+import importlib.util, os
+from bisect import bisect_right
+from types import ModuleType
+from fa import CharTransitionsSet, CompiledTransitions
+from utils import atomic_write
+
+GENERATOR_VERSION = 4
+
+# generated modules loaded by this process, by rules key
+_modules_cache:dict[str, ModuleType] = {}
+
+def _character_classes(intervals:dict[int, list[tuple[int, int, int]]])->tuple[list[int], list[int], list[int], list[list[int]]]:
+    """
+    Groups the code points by their targets in all the states.
+    Returns (ascii classes, wide bounds, wide classes, targets of each class per state).
+    Class 0 holds the code points without any transition.
+    """
+    bounds:list[int] = []
+    classes:list[int] = []
+    def cut(p, c):
+        if len(bounds)>0 and bounds[-1]==p: bounds.pop(); classes.pop()
+        if len(classes)>0 and classes[-1]==c: return
+        bounds.append(p); classes.append(c)
+
+    labelled = [(start, end, (q, q1)) for q, rngs in intervals.items() for start, end, q1 in rngs]
+    signatures:dict[frozenset, int] = {frozenset(): 0}
+    cut(0, 0)
+    for start, end, labels in CharTransitionsSet.sweep_ranges(labelled):
+        signature = frozenset(labels)
+        if not signature in signatures: signatures[signature] = len(signatures)
+        cut(start, signatures[signature])
+        cut(end+1, 0)
+
+    ascii_classes = [classes[bisect_right(bounds, o)-1] for o in range(CompiledTransitions.ASCII_SIZE)]
+
+    targets = [[-1] * len(signatures) for _ in intervals]
+    for signature, c in signatures.items():
+        for q, q1 in signature: targets[q][c] = q1
+    return ascii_classes, bounds, classes, targets
+
+def generate_source(automaton, key:str)->str:
+    """Python source of the lexer module for a CombinedLexerAutomaton"""
+    ascii_classes, bounds, classes, targets = _character_classes(automaton.intervals)
+    classes_count = len(targets[0]) if len(targets)>0 else 1
+    accepting = automaton.accepting_rule
+
+    # accepting states first, so that `offset < ACCEPTING_LIMIT` tells if a state accepts
+    order = sorted(range(len(targets)), key=lambda q:(accepting[q]<0, q))
+    offset = {q: i*classes_count for i, q in enumerate(order)}
+    delta = [offset[q1] if q1>=0 else -1 for q in order for q1 in targets[q]]
+    rule_at = [-1] * len(delta)
+    for q in order: rule_at[offset[q]] = accepting[q]
+    accepting_limit = sum(1 for r in accepting if r>=0) * classes_count
+
+    if classes_count<=256:
+        classes_source = "text.translate(CLASS_MAP).encode('latin-1')"
+    else:
+        classes_source = "list(map(ord, text.translate(CLASS_MAP)))"
+
+    def tuple_source(values:list[int], per_line=32)->str:
+        lines = [", ".join(map(str, values[i:i+per_line])) for i in range(0, len(values), per_line)]
+        return "(\n    " + ",\n    ".join(lines) + ",\n)"
+
+    return f'''# Generated by lexer_codegen.py (version {GENERATOR_VERSION}), do not edit.
+from bisect import bisect_right
+
+RULES_KEY = {repr(key)}
+GENERATOR_VERSION = {GENERATOR_VERSION}
+CLASSES_COUNT = {classes_count}
+
+# character class of the ASCII codes, and of all codes by ranges starting at WIDE_BOUNDS
+ASCII_CLASS = {tuple_source(ascii_classes)}
+WIDE_BOUNDS = {tuple_source(bounds, 8)}
+WIDE_CLASS = {tuple_source(classes)}
+
+# states are identified by their row offset in DELTA (state index * CLASSES_COUNT)
+INITIAL = {offset[0] if len(targets)>0 else 0}
+ACCEPTING_LIMIT = {accepting_limit}
+# DELTA[state + class] = next state, -1 if none
+DELTA = {tuple_source(delta, classes_count)}
+# RULE_AT[state] = rule index accepted by the state, -1 if none
+RULE_AT = {tuple_source(rule_at, classes_count)}
+
+# rules matched by spelling, for tokens of KEYWORD_HOSTS rules
+KEYWORDS = {repr(automaton.keywords)}
+KEYWORD_HOSTS = frozenset({repr(automaton.keyword_hosts)})
+
+class _ClassMap(dict):
+    def __missing__(self, o):
+        c = chr(WIDE_CLASS[bisect_right(WIDE_BOUNDS, o)-1])
+        self[o] = c
+        return c
+
+CLASS_MAP = _ClassMap((o, chr(c)) for o, c in enumerate(ASCII_CLASS))
+
+def match(text, index):
+    """Returns (length, rule index) of the longest token starting at `index`, or (-1, -1)"""
+    q = INITIAL
+    best_len, best_rule = (0, RULE_AT[q]) if q<ACCEPTING_LIMIT else (-1, -1)
+    i = index
+    n = len(text)
+    while i<n:
+        o = ord(text[i])
+        q = DELTA[q + (ASCII_CLASS[o] if o<{CompiledTransitions.ASCII_SIZE} else WIDE_CLASS[bisect_right(WIDE_BOUNDS, o)-1])]
+        if q<0: break
+        i+=1
+        if q<ACCEPTING_LIMIT:
+            best_len = i - index
+            best_rule = RULE_AT[q]
+    if best_rule in KEYWORD_HOSTS:
+        k = KEYWORDS.get(text[index:index+best_len])
+        if k is not None and k<best_rule: best_rule = k
+    return best_len, best_rule
+
+def iter_lex(text, _delta=DELTA, _rule_at=RULE_AT, _limit=ACCEPTING_LIMIT, _initial=INITIAL, _keywords=KEYWORDS, _hosts=KEYWORD_HOSTS):
+    """Yields (rule index, start, length) of the tokens, stops where no token matches"""
+    classes = {classes_source}
+    n = len(text)
+    index = 0
+    while index<n:
+        q = _initial
+        end = index
+        best = -1
+        i = index
+        while i<n:
+            q = _delta[q + classes[i]]
+            if q<0: break
+            i+=1
+            if q<_limit:
+                end = i
+                best = q
+        if end==index: break
+        rule = _rule_at[best]
+        if rule in _hosts:
+            k = _keywords.get(text[index:end])
+            if k is not None and k<rule: rule = k
+        yield rule, index, end-index
+        index = end
+
+def lex(text):
+    """Returns ([(rule index, start, length), ...], end); end < len(text) if no token matches there"""
+    spans = list(iter_lex(text))
+    if len(spans)==0: return spans, 0
+    rule, start, length = spans[-1]
+    return spans, start+length
+'''
+
+def load_source(source:str|None, name:str, path:str|None=None)->ModuleType:
+    """Imports the module from `path` if given, otherwise executes `source` in a fresh module"""
+    if path is not None:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    module = ModuleType(name)
+    exec(compile(source, f"<{name}>", "exec"), module.__dict__)
+    return module
+
+def _is_current(module:ModuleType, key:str)->bool:
+    return getattr(module, 'RULES_KEY', None)==key and getattr(module, 'GENERATOR_VERSION', None)==GENERATOR_VERSION
+
+def get_lexer_module(key:str, build_automaton, path:str|None=None)->ModuleType:
+    """
+    Returns the generated lexer module for the rules `key`.
+    The source is only regenerated (through build_automaton()) if `path` is missing or was generated
+    for other rules; without a path the module only lives in this process.
+    """
+    module = _modules_cache.get(key)
+    if module is not None: return module
+
+    name = f"_lexer_gen_{key[:16]}"
+    if path is not None and os.path.exists(path):
+        try:
+            module = load_source(None, name, path)
+            if not _is_current(module, key): module = None
+        except Exception as e:
+            print(f"Lexer: could not load generated lexer {path}: {e}")
+            module = None
+
+    if module is None:
+        source = generate_source(build_automaton(), key)
+        if path is not None:
+            try:
+                atomic_write(path, source)
+            except OSError as e:
+                print(f"Lexer: could not save generated lexer: {e}")
+        module = load_source(source, name)
+
+    _modules_cache[key] = module
+    return module
@@ -1,5 +1,11 @@
 from __future__ import annotations
+import copy, json, os, struct, sys
+from time import perf_counter
+from array import array
+from collections import Counter
+from collections.abc import Iterable
 from grammar import RuleComponent, NonTerminal, Terminal, Rule, Grammar, Prediction1
+from utils import atomic_write
 
 class AnalysisElement:
     def __init__(self, rule:Rule, dot_position:int, u_predictions:list[Prediction1]):
@@ -43,12 +49,21 @@ class CanonicalCollectionNode:
         self.closure: list[AnalysisElement] = []
         self.elements_hash = sum(map(hash, self.elements))
         self.precomputed_hash = hash(self.nid)+self.elements_hash
+        self.by_symbol:dict[RuleComponent, list[AnalysisElement]]|None = None
 
     def get_transitions(self):
         it = map(lambda _:_.get_after_dot(), self.closure)
         it = filter(lambda _:_ is not None, it)
         return set(it)
 
+    def items_by_symbol(self)->dict[RuleComponent, list[AnalysisElement]]:
+        """Closure items grouped by the component after their dot, built on first use"""
+        if self.by_symbol is None:
+            self.by_symbol = {}
+            for elem in self.closure:
+                if elem.after_dot is not None: self.by_symbol.setdefault(elem.after_dot, []).append(elem)
+        return self.by_symbol
+
     def is_equivalent_to(self, other:CanonicalCollectionNode):
         return self.elements_hash == other.elements_hash and self.elements == other.elements
         #intersect_cnt = len(self.elements.intersection(other.elements))
@@ -81,35 +96,40 @@ class CanonicalCollection:
 
         io = CanonicalCollectionNode(self.grammar, 0, [first_element(self.grammar)])
         self.states.append(io)
-
         self.build_closure(self.grammar, io)
-
-        tr_count = self.transitions_count
-        st_count = 0
-
-        while tr_count!=self.transitions_count or st_count!=len(self.states):
-            tr_count = self.transitions_count
-            st_count = len(self.states)
-
-            for node in self.states:
-                for X in node.get_transitions():
-                    new_node = self.__get_or_create(self.goto(node, X))
-                    if not (node, X) in self.transitions:
-                        self.transitions[(node, X)] = new_node
-                        self.transitions_count+=1
-                    else:
-                        if new_node!=self.transitions[(node,X)]:
-                            raise ValueError("Invalid transition? (different nodes for same transition)")
+        # states by kernel items, to find an existing state in O(1)
+        self.states_by_kernel:dict[frozenset[AnalysisElement], CanonicalCollectionNode] = {frozenset(io.elements): io}
+
+        # worklist: self.states doubles as a FIFO queue, each state is expanded exactly once
+        processed = 0
+        while processed<len(self.states):
+            node = self.states[processed]
+            processed+=1
+            for X in node.get_transitions():
+                self.transitions[(node, X)] = self.__get_or_create(self.goto(node, X))
+                self.transitions_count+=1
 
     def __get_or_create(self, state:CanonicalCollectionNode)->CanonicalCollectionNode:
-        #equiv = list(filter(lambda _:_.is_equivalent_to(state), self.states))
-        equiv = list(filter(state.is_equivalent_to, self.states))
-        if len(equiv)==0:
-            new_state = CanonicalCollectionNode(self.grammar, len(self.states), state.elements)
-            self.states.append(new_state)
-            self.build_closure(self.grammar, new_state)
-            return new_state
-        return equiv[0]
+        kernel = frozenset(state.elements)
+        existing = self.states_by_kernel.get(kernel)
+        if existing is not None: return existing
+        new_state = CanonicalCollectionNode(self.grammar, len(self.states), state.elements)
+        self.states.append(new_state)
+        self.states_by_kernel[kernel] = new_state
+        self.build_closure(self.grammar, new_state)
+        return new_state
+
+    def has_conflicts(self)->bool:
+        """Tells if a state has two actions on a lookahead (reduce items of the closures hold one lookahead)"""
+        for node in self.states:
+            actions:dict[Prediction1, int] = {}
+            for elem in node.closure:
+                if not elem.is_dot_at_end: continue
+                for p in elem.u_predictions:
+                    if actions.setdefault(p, elem.rule.rule_id)!=elem.rule.rule_id: return True
+            for X in node.get_transitions():
+                if isinstance(X, Terminal) and Prediction1.of(X) in actions: return True
+        return False
 
     def __str__(self):
         res = ""
@@ -120,49 +140,239 @@ class CanonicalCollection:
 
 
 class LR1CanonicalCollection(CanonicalCollection):
+    def __lookaheads_after_dot(self, g:Grammar, elem:AnalysisElement)->frozenset[Prediction1]:
+        """Lookaheads of the items generated by the nonterminal after the dot"""
+        key = (elem.rule.rule_id, elem.dot_position)
+        first = self.first_after_dot.get(key)
+        if first is None:
+            sequence = g._first1_sequence_(elem.rule.rhs[elem.dot_position+1:])
+            nullable = len(sequence)==0 or Prediction1.empty() in sequence
+            first = self.first_after_dot[key] = (frozenset(p for p in sequence if p!=Prediction1.empty()), nullable)
+        predictions, nullable = first
+        if not nullable: return predictions
+        return predictions.union(p for p in elem.u_predictions if p!=Prediction1.empty())
+
+    def __closure_template(self, g:Grammar, A:NonTerminal, b:Prediction1)->frozenset[AnalysisElement]:
+        """Closure of the items [A -> .rhs, b] of all the rules of A"""
+        key = (A, b)
+        template = self.closure_templates.get(key)
+        if template is not None: return template
+
+        items = {AnalysisElement(rule, 0, [b]) for rule in g.get_derivations_of(A)}
+        stack = list(items)
+        while len(stack)>0:
+            elem = stack.pop()
+            nxt = elem.get_after_dot()
+            if not isinstance(nxt, NonTerminal): continue
+            for p in self.__lookaheads_after_dot(g, elem):
+                known = self.closure_templates.get((nxt, p))
+                if known is not None:
+                    items |= known
+                    continue
+                for rule in g.get_derivations_of(nxt):
+                    a_elem = AnalysisElement(rule, 0, [p])
+                    if not a_elem in items:
+                        items.add(a_elem)
+                        stack.append(a_elem)
+        template = self.closure_templates[key] = frozenset(items)
+        return template
+
+    def __build_closure(self, g:Grammar, node:CanonicalCollectionNode):
+        closure = set(node.elements)
+        for elem in node.elements:
+            nxt = elem.get_after_dot()
+            if not isinstance(nxt, NonTerminal): continue
+            for p in self.__lookaheads_after_dot(g, elem):
+                closure |= self.__closure_template(g, nxt, p)
+        node.closure = closure
+
     @staticmethod
-    def __build_closure(g:Grammar, node:CanonicalCollectionNode):
-        tmp_elems = set(node.elements)
-        new_elems = []
+    def __goto(n:CanonicalCollectionNode, r:RuleComponent):
+        elems = [e.advance_dot() for e in n.items_by_symbol().get(r, ())]
+        return CanonicalCollectionNode(n.grammar, -1, elems)
 
-        while True:
-            for elem in tmp_elems:
-                nxt = elem.get_after_dot()
-                if nxt is None: continue
-                if not isinstance(nxt, NonTerminal): continue
-                beta = set()
-                beta.update(g._first1_sequence_(elem.rule.rhs[elem.dot_position+1:]))
-                if len(beta)==0 or Prediction1.empty() in beta:
-                    beta.update(elem.u_predictions)
-                beta = [p for p in beta if p!=Prediction1.empty()]
+    @staticmethod
+    def __first_element(g:Grammar):
+        return AnalysisElement(g.rules[0], 0, [Prediction1.end_of_word()])
 
-                for rule in g.get_derivations_of(nxt):
-                    for b in beta:
-                        a_elem = AnalysisElement(rule, 0, [b])
-                        if not a_elem in tmp_elems:
-                            new_elems.append(a_elem)
-            tmp_elems.update(new_elems)
-            # tmp_elems = tmp_elems + new_elems
+    def __init__(self, grammar:Grammar):
+        # FIRST of the rhs after the dot, by (rule id, dot): (lookaheads, can derive the empty word)
+        self.first_after_dot:dict[tuple[int, int], tuple[frozenset[Prediction1], bool]] = {}
+        # closures shared by the states, by (nonterminal, lookahead)
+        self.closure_templates:dict[tuple[NonTerminal, Prediction1], frozenset[AnalysisElement]] = {}
+        CanonicalCollection.__init__(self, grammar, self.__build_closure, self.__goto, self.__first_element)
 
-            #print("____________________________")
-            #for e in new_elems: print(e)
 
-            if len(new_elems)==0: break
-            new_elems.clear()
-        node.closure = tmp_elems
+class LALR1CanonicalCollection(CanonicalCollection):
+    """
+    LR(0) collection whose reduce items get their LALR(1) lookaheads from the DeRemer-Pennello
+    relations (reads, includes, lookback). The closures then hold one reduce item per lookahead,
+    like the ones of LR1CanonicalCollection.
+    """
+    @staticmethod
+    def __build_closure(g:Grammar, node:CanonicalCollectionNode):
+        closure = set(node.elements)
+        stack = list(node.elements)
+        while len(stack)>0:
+            nxt = stack.pop().get_after_dot()
+            if not isinstance(nxt, NonTerminal): continue
+            for rule in g.get_derivations_of(nxt):
+                elem = AnalysisElement(rule, 0, [])
+                if not elem in closure:
+                    closure.add(elem)
+                    stack.append(elem)
+        node.closure = closure
 
     @staticmethod
     def __goto(n:CanonicalCollectionNode, r:RuleComponent):
-        elems = filter(lambda a:a.get_after_dot()==r, n.closure)
-        elems = list(map(lambda _:_.advance_dot(), elems))
+        elems = [e.advance_dot() for e in n.items_by_symbol().get(r, ())]
         return CanonicalCollectionNode(n.grammar, -1, elems)
 
     @staticmethod
     def __first_element(g:Grammar):
-        return AnalysisElement(g.rules[0], 0, [Prediction1.end_of_word()])
+        return AnalysisElement(g.rules[0], 0, [])
+
+    @staticmethod
+    def __digraph(nodes:list, relation:dict[any, list], base:dict[any, set])->dict[any, set]:
+        """F(x) = base(x) U F(y) for all x relation y, computed once per strongly connected component"""
+        done = len(nodes)+1
+        depth:dict[any, int] = {}
+        result:dict[any, set] = {}
+        stack = []
+        for x0 in nodes:
+            if x0 in depth: continue
+            stack.append(x0); depth[x0] = len(stack); result[x0] = set(base[x0])
+            calls = [(x0, iter(relation[x0]), len(stack))]
+            while len(calls)>0:
+                x, it, d = calls[-1]
+                for y in it:
+                    if not y in depth:
+                        stack.append(y); depth[y] = len(stack); result[y] = set(base[y])
+                        calls.append((y, iter(relation[y]), len(stack)))
+                        break
+                    depth[x] = min(depth[x], depth[y])
+                    result[x] |= result[y]
+                else:
+                    calls.pop()
+                    if depth[x]==d:
+                        while True:
+                            top = stack.pop()
+                            depth[top] = done
+                            result[top] = result[x]
+                            if top==x: break
+                    if len(calls)>0:
+                        parent = calls[-1][0]
+                        depth[parent] = min(depth[parent], depth[x])
+                        result[parent] |= result[x]
+        return result
+
+    def __lookaheads(self)->dict[tuple[int, int], set[Prediction1]]:
+        """LALR(1) lookaheads by (state id, rule id) of the reduce items"""
+        g = self.grammar
+        goto = {(node.nid, X): nxt.nid for (node, X), nxt in self.transitions.items()}
+        nullable = {A for A in g.non_terminals if Prediction1.empty() in g.first1_table[A]}
+
+        # the initial item reduces on $: seen as a transition on its lhs from the initial state
+        start = (0, g.rules[0].lhs)
+        transitions = [key for key in goto if isinstance(key[1], NonTerminal)]
+        if not start in goto: transitions.append(start)
+
+        direct:dict[tuple[int, NonTerminal], set[Prediction1]] = {}
+        reads:dict[tuple[int, NonTerminal], list] = {}
+        for p, A in transitions:
+            r = goto.get((p, A))
+            direct[(p, A)] = set()
+            reads[(p, A)] = []
+            if r is not None:
+                for X in self.states[r].get_transitions():
+                    if isinstance(X, Terminal): direct[(p, A)].add(Prediction1.of(X))
+                    elif X in nullable: reads[(p, A)].append((r, X))
+        direct[start].add(Prediction1.end_of_word())
+        read_sets = self.__digraph(transitions, reads, direct)
+
+        includes:dict[tuple[int, NonTerminal], list] = {key: [] for key in transitions}
+        lookback:dict[tuple[int, int], list] = {}
+        for p, B in transitions:
+            closure = self.states[p].closure
+            for rule in g.get_derivations_of(B):
+                if not AnalysisElement(rule, 0, []) in closure: continue
+                q = p
+                for i, X in enumerate(rule.rhs):
+                    if isinstance(X, NonTerminal) and all(Y in nullable for Y in rule.rhs[i+1:]):
+                        includes[(q, X)].append((p, B))
+                    q = goto[(q, X)]
+                lookback.setdefault((q, rule.rule_id), []).append((p, B))
+        follow_sets = self.__digraph(transitions, includes, read_sets)
+
+        lookaheads:dict[tuple[int, int], set[Prediction1]] = {}
+        for key, lb in lookback.items():
+            lookaheads[key] = set().union(*(follow_sets[t] for t in lb))
+        return lookaheads
 
     def __init__(self, grammar:Grammar):
         CanonicalCollection.__init__(self, grammar, self.__build_closure, self.__goto, self.__first_element)
+        lookaheads = self.__lookaheads()
+        for state in self.states:
+            closure = set()
+            for elem in state.closure:
+                if not elem.is_dot_at_end:
+                    closure.add(elem)
+                    continue
+                for p in lookaheads.get((state.nid, elem.rule.rule_id), ()):
+                    closure.add(AnalysisElement(elem.rule, elem.dot_position, [p]))
+            state.closure = closure
+
+
+class IELR1CanonicalCollection(CanonicalCollection):
+    """
+    Canonical LR(1) states merged by core wherever the merge adds no reduce/reduce conflict,
+    then split again until the merged states have consistent transitions.
+    Approximates IELR(1): LALR(1)-sized where the cores merge cleanly, LR(1) states elsewhere.
+    """
+    def __init__(self, canonical:LR1CanonicalCollection):
+        self.grammar = canonical.grammar
+
+        # greedy merge of the states with the same core and compatible reduce lookaheads
+        block:list[int] = [0] * len(canonical.states)
+        blocks_count = 0
+        groups:dict[frozenset, list[tuple[dict[Prediction1, int], int]]] = {}
+        for node in canonical.states:
+            core = frozenset((e.rule.rule_id, e.dot_position) for e in node.elements)
+            reduces = {p: e.rule.rule_id for e in node.closure if e.is_dot_at_end for p in e.u_predictions}
+            group = groups.setdefault(core, [])
+            for merged, b in group:
+                if all(merged.get(p, r)==r for p, r in reduces.items()):
+                    merged.update(reduces)
+                    block[node.nid] = b
+                    break
+            else:
+                group.append((reduces, blocks_count))
+                block[node.nid] = blocks_count
+                blocks_count+=1
+
+        # split the blocks whose states go to different blocks on the same symbol
+        successors:list[dict[RuleComponent, int]] = [{} for _ in canonical.states]
+        for (node, X), nxt in canonical.transitions.items():
+            successors[node.nid][X] = nxt.nid
+        while True:
+            signatures:dict[tuple, int] = {}
+            new_block = [signatures.setdefault((block[q], frozenset((X, block[r]) for X, r in successors[q].items())), len(signatures))
+                for q in range(len(block))]
+            if len(signatures)==blocks_count: break
+            block, blocks_count = new_block, len(signatures)
+
+        members:list[list[CanonicalCollectionNode]] = [[] for _ in range(blocks_count)]
+        for node in canonical.states: members[block[node.nid]].append(node)
+        self.states = []
+        for b, nodes in enumerate(members):
+            state = CanonicalCollectionNode(self.grammar, b, [e for n in nodes for e in n.elements])
+            state.closure = set().union(*(n.closure for n in nodes))
+            self.states.append(state)
+        self.transitions = {}
+        for (node, X), nxt in canonical.transitions.items():
+            self.transitions[(self.states[block[node.nid]], X)] = self.states[block[nxt.nid]]
+        self.transitions_count = len(self.transitions)
+        self.states_by_kernel = {frozenset(state.elements): state for state in self.states}
 
 
 class LR1AnalysisTable:
@@ -212,18 +422,40 @@ class LR1AnalysisTable:
         def __str__(self): return self.type_ + (str(self.value) if self.value>=0 else "")
         def __repr__(self): return f"TableItem<{str(self)}>"
 
-    def __init__(self, grammar:Grammar, path:str=None):
-        from time import time
+    # 'lr1': canonical LR(1); 'lalr1': LR(0) states with LALR(1) lookaheads;
+    # 'ielr1': LALR(1) states, split where LALR(1) merging creates conflicts
+    MODES = ('lr1', 'lalr1', 'ielr1')
+
+    # binary tables: BINARY_MAGIC, JSON header length (uint32), JSON header, padding to 2 bytes,
+    # then int16 cells [state * columns count + column]: 0 error, n+1 shift n, -(r+1) reduce r, accept
+    BINARY_MAGIC = b"LR1TABLE"
+    BINARY_VERSION = 1
+    ACCEPT_CODE = 32767
+
+    def __init__(self, grammar:Grammar, path:str=None, mode:str='lr1', check_conflicts:bool=True, compressed:bool=False):
+        """compressed: load the packed table saved next to `path` (see packed_path) if there is one"""
+        if not mode in LR1AnalysisTable.MODES:
+            raise ValueError(f"Unknown LR table mode: {mode}")
 
         self.table:dict[tuple[int, LR1AnalysisTable.TableColumn], set[LR1AnalysisTable.TableItem]] = {}
 
         self.grammar = grammar
+        self.mode = mode
+        self.check_conflicts = check_conflicts
+        # dense cells of a binary table, self.table stays empty until needed
+        self.cells:array|None = None
+        self.column_index:dict[RuleComponent|None, int] = {}
+        self.decoded_items:dict[int, LR1AnalysisTable.TableItem] = {}
+        # packed form, see compress()
+        self.compressed:CompressedLR1Table|None = None
 
         if path is not None:
+            if compressed and self.load(LR1AnalysisTable.packed_path(path), grammar, compressed=True):
+                return
             if self.load(path, grammar):
                 return
 
-        self.cc = LR1CanonicalCollection(grammar)
+        self.cc = LR1AnalysisTable.build_collection(grammar, mode)
 
         # shift
         for state, sym in self.cc.transitions.keys():
@@ -243,67 +475,248 @@ class LR1AnalysisTable:
                     self.__add_to_table(key, LR1AnalysisTable.TableItem.reduce(elem.rule.rule_id))
 
         if path is not None:
-            self.save(path)
+            try:
+                self.save(path)
+            except OSError as e:
+                print(f"LR1 save: could not save analysis table: {e}")
 
-        print(f"TABLE SIZE = {len(self.table)}")
+        print(f"TABLE SIZE = {len(self.table)} ({self.mode}, {self.states_count} states)")
 
-    def save(self, path:str):
-        lines = []
-        lines.append(str(self.grammar.checksum())+"\n")
-        with open(path, 'w') as f:
-            f.writelines(lines)
-            for key, value in self.table.items():
-                n, tcol = key
+    def __states_count(self)->int:
+        if self.cells is not None: return len(self.cells)//max(1, len(self.column_index))
+        if self.compressed is not None and len(self.table)==0: return self.compressed.states_count
+        return 1+max(n for n, _ in self.table) if len(self.table)>0 else 0
 
-                if tcol.component is None: tcol = 'e $'
-                else:
-                    if isinstance(tcol.component, Terminal):
-                        tcol = 't ' + str(tcol.component.value)
-                    elif isinstance(tcol.component, NonTerminal):
-                        tcol = 'n ' + tcol.component.name
-                    else:
-                        raise RuntimeError("Analysis table serialization failed")
-                v = ' '.join([str(val) for val in value])
-
-                f.writelines(f"{n} {tcol} {v}\n")
-
-    def load(self, path:str, grammar:Grammar):
-        with open(path, 'r') as f:
-            lines = f.read().splitlines()
-            if lines[0]!=str(grammar.checksum()):
-                print("LR1 load: Wrong checksum, outdated grammar")
-                return False
-                #raise RuntimeError("Failed to load analysis table: wrong checksum")
-
-            for line in lines[1:]:
-                L = line.strip()
-                if L=="": continue
-                L = line.split()
-                n, t, v = L[:3]
-
-                if t=='n': t = grammar.get_nonterminal_by_name(v)
-                elif t=='t': t = grammar.get_terminal_by_value(v)
-                elif t=='e': t = Prediction1.end_of_word()
-                else: raise RuntimeError(f"Invalid component type: {t}")
-
-                items = []
-                for it in L[3:]:
-                    if it=='a': items.append(LR1AnalysisTable.TableItem.accepted())
-                    elif it.startswith('r'): items.append(LR1AnalysisTable.TableItem.reduce(int(it[1:])))
-                    elif it.startswith('s'): items.append(LR1AnalysisTable.TableItem.shift(int(it[1:])))
-                    else: raise RuntimeError(f"Invalid table item: {it}")
-
-                key = (int(n), LR1AnalysisTable.TableColumn.of(t))
-                for it in items:
-                    self.__add_to_table(key, it)
+    states_count = property(lambda self: self.__states_count())
+
+    @staticmethod
+    def build_collection(grammar:Grammar, mode:str)->CanonicalCollection:
+        if mode=='lr1': return LR1CanonicalCollection(grammar)
+        cc = LALR1CanonicalCollection(grammar)
+        if mode=='lalr1' or not cc.has_conflicts(): return cc
+        print("LALR(1) merging creates conflicts, splitting canonical LR(1) states")
+        return IELR1CanonicalCollection(LR1CanonicalCollection(grammar))
+
+    @staticmethod
+    def compare_modes(grammar:Grammar, modes:tuple[str]=MODES)->list[tuple[str, int, int, int]]:
+        """Builds the table in each mode, returns (mode, states, entries, conflicts) of each"""
+        result = []
+        for mode in modes:
+            table = LR1AnalysisTable(grammar, None, mode, check_conflicts=False)
+            result.append((mode, table.states_count, len(table.table), len(table.find_conflicts())))
+        return result
+
+    def header(self)->str:
+        checksum = str(self.grammar.checksum())
+        return checksum if self.mode=='lr1' else f"{checksum}:{self.mode}"
+
+    def columns(self)->list[RuleComponent|None]:
+        """Columns of the binary table: $ (None), terminals, non terminals"""
+        return [None, *self.grammar.terminals, *self.grammar.non_terminals]
+
+    @staticmethod
+    def encode_item(item:LR1AnalysisTable.TableItem)->int:
+        if item.is_accepted: return LR1AnalysisTable.ACCEPT_CODE
+        if item.is_shift: code = item.value+1
+        else: code = -(item.value+1)
+        if not -32768<=code<LR1AnalysisTable.ACCEPT_CODE:
+            raise ValueError(f"Table item does not fit in the binary table: {item}")
+        return code
+
+    @staticmethod
+    def decode_item(code:int)->LR1AnalysisTable.TableItem:
+        if code==LR1AnalysisTable.ACCEPT_CODE: return LR1AnalysisTable.TableItem.accepted()
+        if code>0: return LR1AnalysisTable.TableItem.shift(code-1)
+        return LR1AnalysisTable.TableItem.reduce(-code-1)
+
+    def dense(self)->tuple[list[RuleComponent|None], array]:
+        """The table as (columns, int16 cells of the binary format)"""
+        if self.cells is not None:
+            return sorted(self.column_index, key=self.column_index.get), self.cells
+        if self.compressed is not None and len(self.table)==0:
+            return self.compressed.columns, self.compressed.to_dense()
+        columns = self.columns()
+        column_index = {c: i for i, c in enumerate(columns)}
+        cells = array('h', [0]) * (self.states_count * len(column_index))
+        for (n, tcol), items in self.table.items():
+            if len(items)>1: raise RuntimeError("Conflicts in LR1 analysis table, no binary form")
+            for item in items:
+                cells[n*len(column_index) + column_index[tcol.component]] = LR1AnalysisTable.encode_item(item)
+        return columns, cells
+
+    def __decode_cells(self):
+        TC = LR1AnalysisTable.TableColumn
+        columns, cells = self.dense()
+        columns = list(map(TC, columns))
+        width = len(columns)
+        for i, code in enumerate(cells):
+            if code!=0: self.table[(i//width, columns[i%width])] = {LR1AnalysisTable.decode_item(code)}
+
+    def compress(self, default_reductions:bool=True)->CompressedLR1Table:
+        """Packs the table (see CompressedLR1Table), used by the parser and by binary saves from now on"""
+        columns, cells = self.dense()
+        self.compressed = CompressedLR1Table.compress(columns, cells, default_reductions)
+        stats = self.compressed.stats()
+        print(f"TABLE COMPRESSED = {stats['packed_bytes']} bytes (dense {stats['dense_bytes']}), "
+            f"{stats['rows']} rows, {stats['entries']} entries")
+        return self.compressed
+
+    def save_binary(self, path:str):
+        if self.compressed is not None:
+            columns = self.compressed.columns
+            arrays = [(name, getattr(self.compressed, name)) for name, _ in CompressedLR1Table.ARRAYS]
+        else:
+            columns, cells = self.dense()
+            arrays = [('cells', cells)]
+        def spelling(c):
+            if c is None: return "$"
+            return f"t {c.value}" if isinstance(c, Terminal) else f"n {c.name}"
+        header = {
+            'version': LR1AnalysisTable.BINARY_VERSION,
+            'fingerprint': self.grammar.fingerprint(),
+            'mode': self.mode,
+            'states': self.states_count,
+            'columns': list(map(spelling, columns)),
+        }
+        if self.compressed is not None:
+            header['compressed'] = [[name, len(values)] for name, values in arrays]
+        header = json.dumps(header).encode()
+        header += b" " * (len(header) % 2)
+        data = [LR1AnalysisTable.BINARY_MAGIC, struct.pack('<I', len(header)), header]
+        for _, values in arrays:
+            if sys.byteorder=='big':
+                values = array(values.typecode, values)
+                values.byteswap()
+            data.append(values.tobytes())
+        atomic_write(path, b"".join(data))
+
+    @staticmethod
+    def packed_path(path:str)->str:
+        """Binary file of the packed table, next to the dense one at path"""
+        return os.path.splitext(path)[0] + "-packed.bin"
 
+    @staticmethod
+    def binary_header(data:bytes)->tuple[dict, int]|None:
+        """(header, offset of the cells) of a binary table, None if data is not one"""
+        start = len(LR1AnalysisTable.BINARY_MAGIC)
+        if not data.startswith(LR1AnalysisTable.BINARY_MAGIC) or len(data)<start+4: return None
+        header_len, = struct.unpack_from('<I', data, start)
+        try:
+            return json.loads(data[start+4:start+4+header_len]), start+4+header_len
+        except ValueError:
+            return None
+
+    def load_binary(self, data:bytes, grammar:Grammar, compressed:bool=False)->bool:
+        """compressed: expect a packed table, the other form is rejected"""
+        header, offset = LR1AnalysisTable.binary_header(data) or ({}, 0)
+        if header.get('version')!=LR1AnalysisTable.BINARY_VERSION or header.get('fingerprint')!=grammar.fingerprint() \
+            or header.get('mode')!=self.mode:
+            print("LR1 load: Wrong fingerprint, outdated grammar or other table mode")
+            return False
+        if ('compressed' in header)!=compressed:
+            print("LR1 load: Packed table where a dense one is expected" if not compressed else "LR1 load: Dense table where a packed one is expected")
+            return False
+
+        symbols = {"$": None}
+        symbols.update({f"t {t.value}": t for t in grammar.terminals})
+        symbols.update({f"n {n.name}": n for n in grammar.non_terminals})
+        self.column_index = {symbols[s]: i for i, s in enumerate(header['columns'])}
+        if 'compressed' in header:
+            typecodes = dict(CompressedLR1Table.ARRAYS)
+            arrays = {}
+            for name, length in header['compressed']:
+                values = array(typecodes[name])
+                end = offset + length*values.itemsize
+                if end>len(data):
+                    print("LR1 load: Truncated binary table")
+                    self.column_index = {}
+                    return False
+                values.frombytes(memoryview(data)[offset:end])
+                if sys.byteorder=='big': values.byteswap()
+                arrays[name] = values
+                offset = end
+            columns = sorted(self.column_index, key=self.column_index.get)
+            self.compressed = CompressedLR1Table(columns, header['states'], arrays)
             return True
 
+        self.cells = array('h')
+        self.cells.frombytes(memoryview(data)[offset:offset + (len(data)-offset)//2*2])
+        if sys.byteorder=='big': self.cells.byteswap()
+        if len(self.cells)!=header['states']*len(self.column_index):
+            print("LR1 load: Truncated binary table")
+            self.cells = None
+            self.column_index = {}
+            return False
+        return True
+
+    def save(self, path:str):
+        """Binary format for .bin paths, text otherwise"""
+        if path.endswith('.bin'):
+            self.save_binary(path)
+            return
+        if len(self.table)==0: self.__decode_cells()
+        lines = []
+        lines.append(self.header()+"\n")
+        for key, value in self.table.items():
+            n, tcol = key
+
+            if tcol.component is None: tcol = 'e $'
+            else:
+                if isinstance(tcol.component, Terminal):
+                    tcol = 't ' + str(tcol.component.value)
+                elif isinstance(tcol.component, NonTerminal):
+                    tcol = 'n ' + tcol.component.name
+                else:
+                    raise RuntimeError("Analysis table serialization failed")
+            v = ' '.join([str(val) for val in value])
+
+            lines.append(f"{n} {tcol} {v}\n")
+        atomic_write(path, ''.join(lines))
+
+    def load(self, path:str, grammar:Grammar, compressed:bool=False):
+        if not os.path.exists(path): return False
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data.startswith(LR1AnalysisTable.BINARY_MAGIC):
+            return self.load_binary(data, grammar, compressed)
+        # text tables are dense
+        if compressed: return False
+
+        lines = data.decode().splitlines()
+        if len(lines)==0 or lines[0]!=self.header():
+            print("LR1 load: Wrong checksum, outdated grammar or other table mode")
+            return False
+            #raise RuntimeError("Failed to load analysis table: wrong checksum")
+
+        for line in lines[1:]:
+            L = line.strip()
+            if L=="": continue
+            L = line.split()
+            n, t, v = L[:3]
+
+            if t=='n': t = grammar.get_nonterminal_by_name(v)
+            elif t=='t': t = grammar.get_terminal_by_value(v)
+            elif t=='e': t = Prediction1.end_of_word()
+            else: raise RuntimeError(f"Invalid component type: {t}")
+
+            items = []
+            for it in L[3:]:
+                if it=='a': items.append(LR1AnalysisTable.TableItem.accepted())
+                elif it.startswith('r'): items.append(LR1AnalysisTable.TableItem.reduce(int(it[1:])))
+                elif it.startswith('s'): items.append(LR1AnalysisTable.TableItem.shift(int(it[1:])))
+                else: raise RuntimeError(f"Invalid table item: {it}")
+
+            key = (int(n), LR1AnalysisTable.TableColumn.of(t))
+            for it in items:
+                self.__add_to_table(key, it)
+
+        return True
+
     def __add_to_table(self, key:tuple[int, LR1AnalysisTable.TableColumn], item:TableItem):
         if not key in self.table: self.table[key] = set()
         self.table[key].add(item)
 
-        if len(self.table[key])>1:
+        if len(self.table[key])>1 and self.check_conflicts:
             conflicts = self.find_conflicts()
             if len(conflicts)>0:
                 print("Conflicts found:", conflicts)
@@ -361,17 +774,185 @@ class LR1AnalysisTable:
 
     def __getitem__(self, key:tuple[int, RuleComponent|None]):
         state, pred = key
+        if self.cells is not None or (self.compressed is not None and len(self.table)==0):
+            if not pred in self.column_index: code = 0
+            elif self.cells is not None: code = self.cells[state*len(self.column_index) + self.column_index[pred]]
+            else: code = self.compressed.lookup(state, self.column_index[pred])
+            if code==0: return []
+            item = self.decoded_items.get(code)
+            if item is None: item = self.decoded_items[code] = LR1AnalysisTable.decode_item(code)
+            return [item]
         TC = LR1AnalysisTable.TableColumn
         pred = TC.of(pred) if pred is not None else TC.end_of_word()
         key = (state, pred)
         if key in self.table: return list(self.table[key])
         return []
 
+class CompressedLR1Table:
+    """
+    Binary table codes (see LR1AnalysisTable) packed yacc-style:
+    - action rows (terminal columns of a state) lose their most common reduce to the row default,
+      and states with identical rows share one row;
+    - goto rows (states of a non terminal column) lose their most common target to the row default;
+    - the other entries of all the rows share one comb vector, by row displacement: entry (row, i)
+      is entries[base[row] + i] if check[base[row] + i]==row, the row default otherwise.
+    Default reductions also replace error entries: a wrong token may trigger reductions before
+    it is reported, as with LALR(1) tables.
+    """
+    # packed arrays (name, typecode), in binary file order
+    ARRAYS = (('state_row', 'h'), ('column_row', 'h'), ('row_default', 'h'), ('base', 'i'), ('entries', 'h'), ('check', 'h'))
+
+    def __init__(self, columns:list[RuleComponent|None], states_count:int, arrays:dict[str, array]):
+        self.columns = columns
+        self.states_count = states_count
+        self.state_row:array = arrays['state_row'] # action row of each state
+        self.column_row:array = arrays['column_row'] # goto row of each non terminal column, -1 for terminals
+        self.row_default:array = arrays['row_default']
+        self.base:array = arrays['base']
+        self.entries:array = arrays['entries']
+        self.check:array = arrays['check']
+
+    @staticmethod
+    def compress(columns:list[RuleComponent|None], cells:array, default_reductions:bool=True)->CompressedLR1Table:
+        width = len(columns)
+        states_count = len(cells)//width if width>0 else 0
+        rows:list[tuple[int, list[tuple[int, int]]]] = [] # (default, [(index, code), ...])
+        row_ids:dict[tuple, int] = {}
+        def add_row(kind:str, default:int, entries:list[tuple[int, int]])->int:
+            key = (kind, default, tuple(entries))
+            if not key in row_ids:
+                row_ids[key] = len(rows)
+                rows.append((default, entries))
+            return row_ids[key]
+
+        action_columns = [c for c in range(width) if not isinstance(columns[c], NonTerminal)]
+        state_row = array('h')
+        for s in range(states_count):
+            row = [(c, cells[s*width + c]) for c in action_columns if cells[s*width + c]!=0]
+            reduces = Counter(code for _, code in row if code<0)
+            default = reduces.most_common(1)[0][0] if default_reductions and len(reduces)>0 else 0
+            state_row.append(add_row('action', default, [(c, code) for c, code in row if code!=default]))
+
+        column_row = array('h', [-1]) * width
+        for c in range(width):
+            if not isinstance(columns[c], NonTerminal): continue
+            row = [(s, cells[s*width + c]) for s in range(states_count) if cells[s*width + c]!=0]
+            targets = Counter(code for _, code in row)
+            default = targets.most_common(1)[0][0] if len(targets)>0 else 0
+            column_row[c] = add_row('goto', default, [(s, code) for s, code in row if code!=default])
+        if len(rows)>=32767: raise ValueError("Too many rows for a compressed table")
+
+        # first fit, fullest rows first; slots are bits of `occupied`, all the ones below `lowest` are set
+        base = array('i', [0]) * len(rows)
+        occupied = 0
+        entries = array('h')
+        check = array('h')
+        lowest = 0
+        for r in sorted(range(len(rows)), key=lambda r:-len(rows[r][1])):
+            row = rows[r][1]
+            if len(row)==0: continue
+            mask = sum(1<<i for i, _ in row)
+            b = max(0, lowest - row[0][0])
+            while (occupied>>b) & mask: b+=1
+            occupied |= mask<<b
+            end = b + row[-1][0] + 1
+            if end>len(entries):
+                entries.extend([0] * (end-len(entries)))
+                check.extend([-1] * (end-len(check)))
+            for i, code in row:
+                entries[b+i] = code
+                check[b+i] = r
+            base[r] = b
+            while (occupied>>lowest) & 1: lowest+=1
+
+        # room for any index of any row, lookups need no bounds check
+        size = max(base, default=0) + max(width, states_count)
+        entries.extend([0] * (size-len(entries)))
+        check.extend([-1] * (size-len(check)))
+        row_default = array('h', [default for default, _ in rows])
+        return CompressedLR1Table(columns, states_count, {'state_row': state_row, 'column_row': column_row,
+            'row_default': row_default, 'base': base, 'entries': entries, 'check': check})
+
+    def lookup(self, state:int, column:int)->int:
+        """Binary table code of the cell"""
+        r = self.column_row[column]
+        if r<0:
+            r = self.state_row[state]
+            i = self.base[r] + column
+        else:
+            i = self.base[r] + state
+        return self.entries[i] if self.check[i]==r else self.row_default[r]
+
+    def to_dense(self)->array:
+        """Cells of the binary format (with the default reductions in place of errors)"""
+        width = len(self.columns)
+        return array('h', [self.lookup(s, c) for s in range(self.states_count) for c in range(width)])
+
+    def stats(self)->dict[str, int]:
+        return {
+            'dense_bytes': self.states_count * len(self.columns) * 2,
+            'packed_bytes': sum(len(a)*a.itemsize for a in (self.state_row, self.column_row, self.row_default, self.base, self.entries, self.check)),
+            'rows': len(self.row_default),
+            'entries': sum(1 for r in self.check if r>=0),
+        }
+
+class CompiledLR1Table:
+    """
+    The analysis table as a flat list of binary table codes (state * width + column)
+    and the rules as parallel lists, for a parse loop with one lookup per step.
+    For compressed tables, the packed arrays are used instead of the flat list.
+    """
+    def __init__(self, table:LR1AnalysisTable):
+        self.packed = table.compressed
+        if self.packed is None:
+            columns, cells = table.dense()
+            self.actions:list[int] = cells.tolist()
+        else:
+            columns = self.packed.columns
+            self.actions = []
+        column_of = {c: i for i, c in enumerate(columns)}
+        self.column_of:dict[RuleComponent|None, int] = column_of
+        self.width = len(columns)
+        self.states_count = table.states_count
+        self.end_column = column_of[None]
+        # terminal values (tk2key results) to their column
+        self.terminal_column:dict[any, int] = {c.value: i for c, i in column_of.items() if isinstance(c, Terminal)}
+        rules = table.grammar.rules
+        self.goto_column:list[int] = [column_of[r.lhs] for r in rules]
+        self.rule_length:list[int] = [len(r.rhs) for r in rules]
+
+    def cell(self, state:int, column:int)->int:
+        """Binary table code of the cell"""
+        if self.packed is not None: return self.packed.lookup(state, column)
+        return self.actions[state*self.width + column]
+
 class LR1Parser:
-    def __init__(self, grammar:Grammar, path:str=None):
+    def __init__(self, grammar:Grammar, path:str=None, mode:str='lr1', compress:bool=False):
+        """
+        mode: one of LR1AnalysisTable.MODES, the table construction
+        compress: parse on the packed table (less memory, see CompressedLR1Table for error reporting),
+            saved next to the table at `path` (see LR1AnalysisTable.packed_path), which stays dense
+        """
         self.grammar = grammar
-        self.analysis_table = LR1AnalysisTable(self.grammar, path)
+        self.analysis_table = LR1AnalysisTable(self.grammar, path, mode, compressed=compress)
         self.__test_for_conflicts()
+        if compress and self.analysis_table.compressed is None:
+            self.analysis_table.compress()
+            if path is not None:
+                try:
+                    self.analysis_table.save(LR1AnalysisTable.packed_path(path))
+                except OSError as e:
+                    print(f"LR1 save: could not save analysis table: {e}")
+        self.compiled:CompiledLR1Table|None = None
+        # build callbacks of the rules, by rule_id
+        self.rule_callback:list[callable] = [r.build_callback for r in grammar.rules]
+
+    def bind(self, rule_callback:list[callable])->LR1Parser:
+        """Parser sharing the grammar and tables of this one, reducing with other build callbacks"""
+        if self.compiled is None: self.compiled = CompiledLR1Table(self.analysis_table)
+        parser = copy.copy(self)
+        parser.rule_callback = rule_callback
+        return parser
 
     def __test_for_conflicts(self):
         conflicts = self.analysis_table.find_conflicts()
@@ -379,11 +960,64 @@ class LR1Parser:
             print("Conflicts found:", conflicts)
             raise RuntimeError("Conflicts in LR1 analysis table")
 
-    def parse_tokens(self, tokens:list[any], tk2term:callable[[any], Terminal],
-        verbose:bool=False):
+    @staticmethod
+    def __failure(token, error:Exception|None=None, fetch_error:Exception|None=None)->dict:
+        if error is None:
+            if token is None:
+                return {
+                    'success': False,
+                    'message': f'Unexpected end of input'
+                }
+            return {
+                'success': False,
+                'message': f'Parse failed at {token.row}:{token.col}: Unexpected token `{token.value}`'
+            }
+        if error is fetch_error:
+            return {
+                'success': False,
+                'message': str(error),
+                'error': error
+            }
+        if token is None:
+            return {
+                'success': False,
+                'message': f'Parse failed at end of input: {str(error)}',
+                'error': error
+            }
+        return {
+            'success': False,
+            'message': f'Parse failed at {token.row}:{token.col} (near `{token.value}`): {str(error)}',
+            'error': error
+        }
+
+    def parse_tokens(self, tokens:Iterable[any], tk2term:callable[[any], Terminal],
+        verbose:bool=False, tk2key:callable[[any], any]|None=None, profiler:ParseProfiler|None=None):
+        """
+        tokens can be any iterable (e.g. a generator lexing on demand), read with one token lookahead.
+        An exception raised while getting the next token fails the parse with its own message.
+        tk2key (optional) gives the value of a token's terminal without building the Terminal.
+        Parses run on the compiled table, except verbose ones which trace every step.
+        profiler (optional): records the statistics of the parse (ignored by verbose parses)
+        """
+        if not verbose:
+            if tk2key is None: tk2key = lambda tk: tk2term(tk).value
+            if profiler is not None:
+                if self.compiled is None: self.compiled = CompiledLR1Table(self.analysis_table)
+                tokens, rule_callback = profiler.instrument(self.grammar, tokens, tk2key, self.rule_callback)
+                start = perf_counter()
+                try:
+                    return self.__parse_compiled(tokens, tk2key, rule_callback=rule_callback)
+                finally:
+                    profiler.finish(perf_counter()-start)
+            return self.__parse_compiled(tokens, tk2key)
         work_stack = [0]
         out_stack = []
         tk_pos = 0
+        tokens_iter = iter(tokens)
+        # lookahead token (None at the end of input) and its terminal
+        current_token = None
+        current_term = None
+        fetch_error = None
 
         class StackRuleComponent:
             def __init__(self, r:RuleComponent, value=None):
@@ -417,33 +1051,41 @@ class LR1Parser:
                     poped.append(it.value)
             return poped[::-1]
 
+        def fetch():
+            nonlocal current_token, current_term, fetch_error
+            try:
+                current_token = next(tokens_iter, None)
+            except Exception as e:
+                fetch_error = e
+                raise
+            current_term = tk2term(current_token) if current_token is not None else None
+
         def do_shift()->LR1AnalysisTable.TableItem:
             nonlocal tk_pos
-            c = StackRuleComponent(tk2term(tokens[tk_pos]), tokens[tk_pos]) if tk_pos<len(tokens) else None
+            c = StackRuleComponent(current_term, current_token) if current_token is not None else None
             push_result = push(c)
             if push_result is None: return None
-            if tk_pos<len(tokens): tk_pos += 1
+            if current_token is not None:
+                tk_pos += 1
+                fetch()
             return push_result
 
         def do_reduce()->LR1AnalysisTable.TableItem:
-            c = tk2term(tokens[tk_pos]) if tk_pos<len(tokens) else None
-            nxt = get_next_action(c)
+            nxt = get_next_action(current_term)
             if nxt is None or not nxt.is_reduce: return None
             rule = self.grammar.rules[nxt.value]
             poped = pop(len(rule.rhs))
             if poped is None: return None
             # print(rule)
             attributes = list(map(lambda _:_.value if isinstance(_, NonTerminal) else _, poped))
-            if push(StackRuleComponent(rule.lhs, rule.process_match(attributes))) is None:
+            if push(StackRuleComponent(rule.lhs, self.rule_callback[rule.rule_id](attributes))) is None:
                 for p in poped: push(p)
                 return None
             out_stack.append(rule.rule_id)
             return nxt
 
         def do_accept():
-            #c = StackRuleComponent(tk2term(tokens[tk_pos]), tokens[tk_pos]) if tk_pos<len(tokens) else None
-            c = tk2term(tokens[tk_pos]) if tk_pos<len(tokens) else None
-            nxt = get_next_action(c)
+            nxt = get_next_action(current_term)
             if nxt is None or not nxt.is_accepted: return None
             return nxt
 
@@ -458,10 +1100,11 @@ class LR1Parser:
 
         try:
             output = None
+            fetch()
             while True:
                 if verbose:
                     res = f"({''.join(map(str, work_stack))}; "
-                    res += f"{','.join(map(str, tokens[tk_pos:]))}$; "
+                    res += f"{current_token if current_token is not None else ''}...$; "
                     res += f"{','.join(map(str, out_stack[::-1]))}; "
                     res += f") |-"
                     print(res, end="")
@@ -470,25 +1113,278 @@ class LR1Parser:
                 if r=='err' or r=='a':
                     break
         except Exception as e:
-            return {
-                'success': False,
-                'message': f'Parse failed at {tokens[tk_pos].row}:{tokens[tk_pos].col} (near `{tokens[tk_pos].value}`): {str(e)}',
-                'error': e
-            }
+            return LR1Parser.__failure(current_token, e, fetch_error)
 
         if r=="err":
-            if tk_pos>=len(tokens):
-                return {
-                    'success': False,
-                    'message': f'Unexpected end of input'
-                }
-            return {
-                'success': False,
-                'message': f'Parse failed at {tokens[tk_pos].row}:{tokens[tk_pos].col}: Unexpected token `{tokens[tk_pos].value}`'
-            }
+            return LR1Parser.__failure(current_token)
         if r=="a":
             result = work_stack[-2].value
             return {
                 'success': True,
                 'value': result
             }
+
+    def parse_incremental(self, tokens:Iterable[any], tk2key:callable[[any], any], session:IncrementalLR1Parse, keep:int=0)->dict:
+        """
+        Parses `tokens`, the input following the boundary of the session's snapshot number `keep`
+        (0: the whole input), on the stack of that snapshot. The later snapshots are replaced by the
+        ones of this parse; restoring the caller's state to the snapshot's checkpoint is up to the caller.
+        """
+        states, values = session.restart(keep)
+        return self.__parse_compiled(tokens, tk2key, session, states, values)
+
+    def __parse_compiled(self, tokens:Iterable[any], tk2key:callable[[any], any],
+        session:IncrementalLR1Parse|None=None, states:list[int]|None=None, values:list|None=None,
+        rule_callback:list[callable]|None=None):
+        if self.compiled is None: self.compiled = CompiledLR1Table(self.analysis_table)
+        compiled = self.compiled
+        actions = compiled.actions
+        width = compiled.width
+        terminal_column = compiled.terminal_column
+        goto_column = compiled.goto_column
+        rule_length = compiled.rule_length
+        if rule_callback is None: rule_callback = self.rule_callback
+        accept = LR1AnalysisTable.ACCEPT_CODE
+        packed = compiled.packed
+        if packed is not None:
+            state_row, column_row, row_default = packed.state_row, packed.column_row, packed.row_default
+            base, entries, check = packed.base, packed.entries, packed.check
+
+        # shifts to the boundary states are reported to the session
+        boundary_column, boundary_states = session.boundaries(compiled) if session is not None else (-2, None)
+
+        if states is None: states, values = [0], []
+        tokens_iter = iter(tokens)
+        token = None
+        fetch_error = None
+        try:
+            try:
+                token = next(tokens_iter, None)
+            except Exception as e:
+                fetch_error = e
+                raise
+            # column of the lookahead, -1 for tokens without a terminal in the grammar
+            column = terminal_column.get(tk2key(token), -1) if token is not None else compiled.end_column
+            while column>=0:
+                if packed is None:
+                    action = actions[states[-1]*width + column]
+                else:
+                    r = state_row[states[-1]]
+                    i = base[r] + column
+                    action = entries[i] if check[i]==r else row_default[r]
+                if action==0: break
+                if action==accept:
+                    return {
+                        'success': True,
+                        'value': values[-1]
+                    }
+                if action>0:
+                    states.append(action-1)
+                    values.append(token)
+                    if column==boundary_column and action-1 in boundary_states: session.record(token, states, values)
+                    try:
+                        token = next(tokens_iter, None)
+                    except Exception as e:
+                        fetch_error = e
+                        raise
+                    column = terminal_column.get(tk2key(token), -1) if token is not None else compiled.end_column
+                    continue
+                rule = -action-1
+                n = rule_length[rule]
+                if n>0:
+                    children = values[-n:]
+                    del values[-n:]
+                    del states[-n:]
+                else:
+                    children = []
+                value = rule_callback[rule](children)
+                if packed is None:
+                    goto = actions[states[-1]*width + goto_column[rule]]
+                else:
+                    r = column_row[goto_column[rule]]
+                    i = base[r] + states[-1]
+                    goto = entries[i] if check[i]==r else row_default[r]
+                if goto<=0 or goto==accept: break
+                states.append(goto-1)
+                values.append(value)
+        except Exception as e:
+            return LR1Parser.__failure(token, e, fetch_error)
+        return LR1Parser.__failure(token)
+
+
+class IncrementalLR1Parse:
+    """
+    Snapshots of a parse, to parse the next versions of the input from the last snapshot before
+    their first change (see LR1Parser.parse_incremental) instead of from the start.
+
+    A boundary is the shift of the `boundary` terminal (its tk2key value) right after a goto on
+    `after`, e.g. the `;` ending a statement. There, checkpoint(token, value of `after`) saves the
+    caller's own state (e.g. its symbol tables) and returns it, or None to skip the boundary.
+    The stacks at the recorded boundaries must extend each other, as the items of a right
+    recursive list do: only the deepest one (the spine) is kept, the others are its prefixes.
+    """
+    def __init__(self, after:NonTerminal, boundary:any, checkpoint:callable[[any, any], any]):
+        self.after = after
+        self.boundary = boundary
+        self.checkpoint = checkpoint
+        # (depth of the values stack, boundary token, checkpoint)
+        self.snapshots:list[tuple[int, any, any]] = []
+        self.spine_states:list[int] = [0]
+        self.spine_values:list = []
+        self.__boundaries:tuple[int, set[int]]|None = None
+
+    def boundaries(self, compiled:CompiledLR1Table)->tuple[int, set[int]]:
+        """Column of the boundary terminal, and the states it is shifted to right after a goto on `after`"""
+        if self.__boundaries is None:
+            accept = LR1AnalysisTable.ACCEPT_CODE
+            column = compiled.terminal_column[self.boundary]
+            after_column = compiled.column_of[self.after]
+            gotos = set(compiled.cell(s, after_column) for s in range(compiled.states_count))
+            shifts = set(compiled.cell(g-1, column) for g in gotos if 0<g<accept)
+            self.__boundaries = column, set(code-1 for code in shifts if 0<code<accept)
+        return self.__boundaries
+
+    def record(self, token, states:list[int], values:list):
+        checkpoint = self.checkpoint(token, values[-2])
+        if checkpoint is None: return
+        depth = len(self.spine_values)
+        if len(values)<=depth or (depth>0 and values[depth-1] is not self.spine_values[-1]):
+            raise RuntimeError("Incremental parse: the stack at a boundary does not extend the stack at the previous one")
+        self.spine_states.extend(states[depth+1:])
+        self.spine_values.extend(values[depth:])
+        self.snapshots.append((len(values), token, checkpoint))
+
+    def restart(self, keep:int)->tuple[list[int], list]:
+        """Drops the snapshots after the first `keep` ones, returns copies of the stacks at the last one kept"""
+        if not 0<=keep<=len(self.snapshots):
+            raise ValueError(f"Incremental parse: no snapshot {keep} (out of {len(self.snapshots)})")
+        del self.snapshots[keep:]
+        depth = self.snapshots[-1][0] if keep>0 else 0
+        del self.spine_states[depth+1:]
+        del self.spine_values[depth:]
+        return list(self.spine_states), list(self.spine_values)
+
+
+class ParseProfiler:
+    """
+    Statistics of the parses run with it (see LR1Parser.parse_tokens), added up over all of them:
+    shifts per terminal, reductions and time of the semantic action (on_build callback) per rule,
+    maximum stack depth, time spent getting the tokens (lexing, for a lazy token stream) and total time.
+    The time left (total - tokens - actions) is spent on table lookups and the stacks.
+    Parses run by an action (e.g. imports) are recorded as parses of their own, not in the action's time,
+    and are part of the total time of the outermost parse only.
+
+    Usage:
+        profiler = ParseProfiler()
+        parser.parse_tokens(tokens, tk2term, profiler=profiler)
+        print(profiler.report(limit=20))
+        profiler.save_json("parse_profile.json")
+    """
+    def __init__(self):
+        self.parses = 0
+        self.total_time = 0.0
+        self.tokens_time = 0.0
+        self.max_depth = 0
+        self.shifts:Counter = Counter()
+        self.rules:list[str] = []
+        self.reductions:list[int] = []
+        self.action_time:list[float] = []
+        # time of the nested parses, and its value when each parse in progress started
+        self.__nested_time = 0.0
+        self.__nested_at_start:list[float] = []
+
+    def instrument(self, grammar:Grammar, tokens:Iterable[any], tk2key:callable[[any], any],
+        rule_callback:list[callable])->tuple[Iterable[any], list[callable]]:
+        """The tokens and rule callbacks of a parse, counting and timing what goes through them"""
+        rules = grammar.rules
+        if len(self.rules)!=len(rules):
+            self.rules = [str(rule) for rule in rules]
+            self.reductions = [0] * len(rules)
+            self.action_time = [0.0] * len(rules)
+        self.parses += 1
+        self.__nested_at_start.append(self.__nested_time)
+        # stack depth of this parse: a token is shifted when the next one is read, a rule replaces its rhs by its lhs
+        depth = 0
+
+        def timed_tokens():
+            nonlocal depth
+            tokens_iter = iter(tokens)
+            previous = None
+            while True:
+                start = perf_counter()
+                token = next(tokens_iter, None)
+                self.tokens_time += perf_counter()-start
+                if previous is not None:
+                    self.shifts[tk2key(previous)] += 1
+                    depth += 1
+                    if depth>self.max_depth: self.max_depth = depth
+                if token is None: return
+                yield token
+                previous = token
+
+        def timed_callback(rule:Rule):
+            callback = rule_callback[rule.rule_id]
+            rule_id = rule.rule_id
+            growth = 1-len(rule.rhs)
+            def f(children):
+                nonlocal depth
+                start, nested = perf_counter(), self.__nested_time
+                try:
+                    return callback(children)
+                finally:
+                    self.action_time[rule_id] += perf_counter()-start - (self.__nested_time-nested)
+                    self.reductions[rule_id] += 1
+                    depth += growth
+                    if depth>self.max_depth: self.max_depth = depth
+            return f
+
+        return timed_tokens(), [timed_callback(rule) for rule in rules]
+
+    def finish(self, seconds:float):
+        """Ends the parse started by the last instrument() call, which took `seconds`"""
+        nested_at_start = self.__nested_at_start.pop()
+        if len(self.__nested_at_start)>0:
+            # the parses nested in this one are already in `seconds`: the enclosing action leaves them out once
+            self.__nested_time = nested_at_start + seconds
+        else:
+            self.total_time += seconds
+
+    def to_dict(self)->dict:
+        actions_time = sum(self.action_time)
+        return {
+            'parses': self.parses,
+            'total_time': self.total_time,
+            'tokens_time': self.tokens_time,
+            'actions_time': actions_time,
+            'parser_time': self.total_time - self.tokens_time - actions_time,
+            'max_depth': self.max_depth,
+            'shifts': dict(self.shifts.most_common()),
+            'rules': [{'rule_id': i, 'rule': rule, 'reductions': self.reductions[i], 'time': self.action_time[i]}
+                for i, rule in enumerate(self.rules)]
+        }
+
+    def save_json(self, path:str):
+        atomic_write(path, json.dumps(self.to_dict(), indent=1))
+
+    def report(self, limit:int|None=None)->str:
+        """Text report, rules sorted by decreasing action time"""
+        data = self.to_dict()
+        total = data['total_time'] or 1.0
+        def share(seconds): return f"{seconds*1000:10.2f} ms {100*seconds/total:5.1f}%"
+        lines = [
+            f"Parses: {data['parses']}, max stack depth: {data['max_depth']}",
+            f"Total      {share(data['total_time'])}",
+            f"Tokens     {share(data['tokens_time'])}",
+            f"Actions    {share(data['actions_time'])}",
+            f"Parser     {share(data['parser_time'])}",
+            "",
+            f"{'rule':>5} {'reductions':>10} {'time':>13} {'share':>6} {'avg us':>8}  rule",
+        ]
+        rules = sorted((r for r in data['rules'] if r['reductions']>0), key=lambda r:(-r['time'], r['rule_id']))
+        for r in rules[:limit]:
+            lines.append(f"{r['rule_id']:>5} {r['reductions']:>10} {share(r['time'])} {1e6*r['time']/r['reductions']:>8.1f}  {r['rule']}")
+        lines.append("")
+        lines.append(f"{'shifts':>10}  terminal")
+        for terminal, count in list(data['shifts'].items())[:limit]:
+            lines.append(f"{count:>10}  {terminal}")
+        return "\n".join(lines)
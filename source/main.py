@@ -6,7 +6,7 @@ from cels2cpp import CelsEnv2Cpp
 def read_file(path):
     with open(path) as f: return f.read()
 
-c2a = ModularCels2AST(lr1_path="cels_lr1_at.txt")
+c2a = ModularCels2AST()
 
 r = c2a.build_ast(read_file("_test.cels"))
 
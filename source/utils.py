@@ -1,3 +1,4 @@
+import os, tempfile
 
 def ensure_type(var:any, *expected_types:list[type]):
     if None in expected_types and var is None:
@@ -20,4 +21,35 @@ class IdProvider:
         self._id += 1
         return self._id
 
-    def __call__(self): return self.create_id()
\ No newline at end of file
+    def __call__(self): return self.create_id()
+
+    last_id = property(lambda s:s._id)
+
+    def restore(self, last_id:int): self._id = last_id
+
+class Interner:
+    """Small integer ids of hashable values: equal values get the same id, starting at 1"""
+    def __init__(self):
+        self._ids:dict[any, int] = {}
+
+    def __call__(self, value)->int:
+        i = self._ids.get(value)
+        if i is None: i = self._ids[value] = len(self._ids)+1
+        return i
+
+    def __len__(self): return len(self._ids)
+
+def atomic_write(path:str, data:str|bytes):
+    """Writes the file through a temporary sibling and a rename, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    mode, encoding = ('wb', None) if isinstance(data, bytes) else ('w', 'utf8')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix="-"+os.path.basename(path))
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            f.write(data)
+        umask = os.umask(0); os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
@@ -0,0 +1,17 @@
+import os, sys
+import pytest
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source")
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+sys.path.insert(0, os.path.abspath(SOURCE_DIR))
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    """Parse tables (see cels_cache.user_cache_dir) are cached in a temporary directory, not in the user's cache"""
+    path = str(tmp_path_factory.mktemp("cels_cache"))
+    previous = os.environ.get("CELS_CACHE_DIR")
+    os.environ["CELS_CACHE_DIR"] = path
+    yield path
+    if previous is None: del os.environ["CELS_CACHE_DIR"]
+    else: os.environ["CELS_CACHE_DIR"] = previous
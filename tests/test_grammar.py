@@ -0,0 +1,72 @@
+import pytest
+from grammar import Grammar, RuleComponentFactory, rule_callbacks as rc
+from cels2ast import Cels2AST
+
+class Owner:
+    def pair(self, a, b): return (self, a, b)
+
+def pair_grammar(owner:Owner, callback)->Grammar:
+    rcf = RuleComponentFactory()
+    S = rcf.non_terminal("S")
+    a, b = rcf.terminal("a"), rcf.terminal("b")
+    return Grammar([(S << a * b).on_build(callback)], owner=owner)
+
+def compiled_rules(*callbacks)->list:
+    """One rule `N<i> << a b` per callback"""
+    rcf = RuleComponentFactory()
+    a, b = rcf.terminal("a"), rcf.terminal("b")
+    rules = [(rcf.non_terminal(f"N{i}") << a * b).on_build(callback) for i, callback in enumerate(callbacks)]
+    return Grammar(rules).rules
+
+def same_results(rule, children):
+    try: expected = rule.process_match(children)
+    except Exception as e:
+        with pytest.raises(type(e)): rule.build_callback(children)
+    else:
+        assert rule.build_callback(children) == expected
+
+def test_compiled_callbacks_match_process_match():
+    rules = compiled_rules(
+        rc.switch(rc.arg(0), [("a", rc.arg(1)), ("b", "B"), (rc.arg(1), "same")]),
+        rc.sum(0)(rc.arg(0), rc.arg(1)),
+        rc.select(rc.arg(1), str.upper),
+        rc.listof(rc.arg(1), "k", rc.arg(0)),
+        rc.call(divmod, rc.arg(1), rc.arg(0)),
+        rc.nocall("constant"),
+        lambda x, y: (y, x),
+        rc.arg(3)) # the last two are not generated, they are called as they are
+    for rule in rules:
+        assert rule.build_callback != rule.process_match
+        for children in (["a", "x"], ["b", "x"], ["c", "c"], ["c", "x"], [2, 7], [[1], [2]]):
+            same_results(rule, children)
+
+def test_sum_default_of_an_empty_rule():
+    rcf = RuleComponentFactory()
+    S, E = rcf.non_terminal("S"), rcf.non_terminal("E")
+    a = rcf.terminal("a")
+    grammar = Grammar([(S << E * a).on_build(rc.arg(1)), (E << rcf.epsilon()).on_build(rc.sum("default"))])
+    rule = grammar.rules[1]
+    assert rule.build_callback != rule.process_match
+    assert rule.build_callback([]) == rule.process_match([]) == "default"
+
+def test_callbacks_are_bound_to_another_owner():
+    owner, other = Owner(), Owner()
+    grammar = pair_grammar(owner, rc.call(owner.pair, rc.arg(0), rc.arg(1)))
+    [callback] = grammar.bind_callbacks(other)
+    assert callback(["a", "b"]) == (other, "a", "b")
+    assert grammar.rules[0].build_callback(["a", "b"]) == (owner, "a", "b")
+
+def test_callbacks_holding_the_owner_are_rejected():
+    owner = Owner()
+    with pytest.raises(RuntimeError):
+        pair_grammar(owner, rc.call(lambda a, b: owner.pair(a, b), rc.arg(0), rc.arg(1)))
+    with pytest.raises(RuntimeError):
+        pair_grammar(owner, lambda args, owner=owner: owner.pair(*args))
+
+def test_subclasses_get_their_own_grammar():
+    class SubCels2AST(Cels2AST): pass
+    grammar = Cels2AST.shared_parser()[0]
+    sub_grammar = SubCels2AST.shared_parser()[0]
+    assert sub_grammar is not grammar
+    assert sub_grammar.checksum() == grammar.checksum()
+    assert SubCels2AST.shared_parser()[0] is sub_grammar
@@ -0,0 +1,55 @@
+import os
+from conftest import EXAMPLES_DIR
+from cels_modular import ModularCels2AST
+from cels2cpp import CelsEnv2Cpp
+
+CELSTRIS_DIR = os.path.abspath(os.path.join(EXAMPLES_DIR, "gba_celstris", "cels"))
+
+def read_celstris():
+    with open(os.path.join(CELSTRIS_DIR, "celstris.cels")) as f:
+        return f.read()
+
+def new_builder():
+    builder = ModularCels2AST()
+    builder.import_solver.base_dir = CELSTRIS_DIR
+    return builder
+
+def compile_cpp(builder):
+    code = CelsEnv2Cpp(builder.env).compile_env().get_full_code()
+    return [line for line in code.splitlines() if "Built at" not in line]
+
+def full_build_cpp(code):
+    builder = new_builder()
+    builder.build_ast(code)
+    return compile_cpp(builder)
+
+def test_compile_between_incremental_builds():
+    code = read_celstris()
+    builder = new_builder()
+    builder.build_ast_incremental(code)
+    compile_cpp(builder)
+
+    pos = code.rindex(";\n")+2
+    edited = code[:pos]+" "+code[pos:]
+    builder.build_ast_incremental(edited)
+
+    assert compile_cpp(builder) == full_build_cpp(edited)
+
+def test_compile_is_repeatable():
+    builder = new_builder()
+    builder.build_ast(read_celstris())
+    assert compile_cpp(builder) == compile_cpp(builder)
+
+def test_edit_before_import():
+    code = read_celstris()
+    builder = new_builder()
+    builder.build_ast_incremental(code)
+
+    pos = code.index("import")
+    edited = code[:pos]+"\n"+code[pos:]
+    ast = builder.build_ast_incremental(edited)
+
+    full = new_builder()
+    assert str(ast) == str(full.build_ast(edited))
+    assert builder.env.global_scope.to_str_recursive() == full.env.global_scope.to_str_recursive()
+    assert compile_cpp(builder) == compile_cpp(full)
@@ -0,0 +1,41 @@
+import pytest
+from lexer import RegularExpression, LexicalError
+from cels2tokens import CelsLexer
+
+KEYWORDS_TEXT = """
+iffy if end_ end endif fi fix do done true truex false_ _if var vars import imports
+function functions begin begin_ 1.5 if2 "if" /* end */ and andy or or_ not
+"""
+
+def spellings(lexer:CelsLexer, text:str)->list[tuple[str, str, int]]:
+    return [(t.token_type, t.value, t.pos) for t in lexer.tokenize(text)]
+
+def test_finite_language():
+    assert sorted(RegularExpression(r'(true)|(false)').fa.get_finite_language()) == ["false", "true"]
+    assert RegularExpression(r'[_A-Za-z][_A-Za-z0-9]*').fa.get_finite_language() is None
+
+def test_keyword_table_tokenizes_as_the_automaton(tmp_path):
+    lexer = CelsLexer(keyword_table=True)
+    keywords, hosts = lexer.find_keywords()
+    assert "if" in keywords and "end" in keywords and "true" in keywords
+    assert [lexer.rules[i][0] for i in hosts] == ["ID"]
+
+    expected = spellings(CelsLexer(), KEYWORDS_TEXT)
+    assert ("ID", "iffy", 1) in expected and ("KW_IF", "if", 6) in expected
+    assert ("ID", "end_", 9) in expected
+    assert spellings(lexer, KEYWORDS_TEXT) == expected
+    codegen = CelsLexer(engine='codegen', module_path=str(tmp_path / "lexer_gen.py"), keyword_table=True)
+    assert spellings(codegen, KEYWORDS_TEXT) == expected
+
+def test_error_order():
+    lexer = CelsLexer()
+    text = "var x = 1true;\nvar y = #;"
+    # the whole text is lexed before the separations are checked, as the original CelsLexer.parse did
+    assert "Invalid token" in lexer.tokenize(text).error
+    assert "Invalid token" in lexer.parse(text)['error']
+    # streaming raises the first error of the text
+    with pytest.raises(LexicalError, match="must be a space"):
+        list(lexer.iter_tokens(text))
+    # the base parameters are kept
+    assert len(lexer.tokenize("1true", separated=())) == 2
+    assert [t.token_type for t in lexer.iter_tokens("a b", skip=())] == ["ID", "WS", "ID"]
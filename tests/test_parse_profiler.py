@@ -0,0 +1,24 @@
+import os
+from time import perf_counter
+from conftest import EXAMPLES_DIR
+from cels_modular import ModularCels2AST
+from lr1 import ParseProfiler
+
+CELSTRIS_DIR = os.path.abspath(os.path.join(EXAMPLES_DIR, "gba_celstris", "cels"))
+
+def test_nested_parses_are_timed_once():
+    builder = ModularCels2AST()
+    builder.import_solver.base_dir = CELSTRIS_DIR
+    builder.profiler = profiler = ParseProfiler()
+    with open(os.path.join(CELSTRIS_DIR, "celstris.cels")) as f:
+        code = f.read()
+
+    start = perf_counter()
+    builder.build_ast(code)
+    elapsed = perf_counter()-start
+
+    data = profiler.to_dict()
+    # celstris.cels and its two imports
+    assert data['parses'] == 3
+    assert data['total_time'] <= elapsed
+    assert data['tokens_time'] + data['actions_time'] <= data['total_time']
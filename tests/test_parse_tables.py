@@ -0,0 +1,95 @@
+import os, shutil, json, struct
+import pytest
+from cels2ast import Cels2AST
+from grammar import Grammar, RuleComponentFactory
+from lr1 import LR1Parser, LR1AnalysisTable
+
+def expression_grammar()->Grammar:
+    rcf = RuleComponentFactory()
+    P, E, T = rcf.non_terminal("P"), rcf.non_terminal("E"), rcf.non_terminal("T")
+    plus, lparen, rparen, x = map(rcf.terminal, "+()x")
+    return Grammar([P << E, E << E * plus * T, E << T, T << lparen * E * rparen, T << x])
+
+def rewrite_header(path:str, **changes):
+    with open(path, 'rb') as f:
+        data = f.read()
+    header, offset = LR1AnalysisTable.binary_header(data)
+    header.update(changes)
+    header = json.dumps(header).encode()
+    header += b" " * (len(header) % 2)
+    with open(path, 'wb') as f:
+        f.write(LR1AnalysisTable.BINARY_MAGIC + struct.pack('<I', len(header)) + header + data[offset:])
+
+def test_packed_table_is_saved_next_to_the_dense_one(tmp_path):
+    grammar = Cels2AST.shared_parser()[0]
+    path = str(tmp_path / "cels_lr1_at.bin")
+    shutil.copyfile(Cels2AST.SHIPPED_TABLE, path)
+    size = os.path.getsize(path)
+
+    parser = LR1Parser(grammar, path, 'lr1', compress=True)
+    assert parser.analysis_table.compressed is not None
+    assert os.path.getsize(path) == size
+    packed_path = LR1AnalysisTable.packed_path(path)
+    assert os.path.exists(packed_path)
+
+    # loaded as it is the next time
+    table = LR1AnalysisTable(grammar, path, 'lr1', compressed=True)
+    assert table.compressed is not None and table.cells is None
+
+def test_load_rejects_the_other_table_form(tmp_path):
+    grammar = Cels2AST.shared_parser()[0]
+    path = str(tmp_path / "cels_lr1_at.bin")
+    shutil.copyfile(Cels2AST.SHIPPED_TABLE, path)
+    LR1Parser(grammar, path, 'lr1', compress=True)
+
+    with open(LR1AnalysisTable.packed_path(path), 'rb') as f:
+        packed = f.read()
+    with open(path, 'rb') as f:
+        dense = f.read()
+    table = LR1AnalysisTable(grammar, path, 'lr1')
+    assert not table.load_binary(packed, grammar)
+    assert table.load_binary(packed, grammar, compressed=True)
+    assert not table.load_binary(dense, grammar, compressed=True)
+
+@pytest.mark.parametrize("changes", [
+    {'fingerprint': "0"*64},
+    {'version': LR1AnalysisTable.BINARY_VERSION+1},
+])
+def test_outdated_binary_table_is_rebuilt(tmp_path, changes):
+    grammar = expression_grammar()
+    path = str(tmp_path / "expression.bin")
+    built = LR1AnalysisTable(grammar, path, 'lr1')
+    assert not hasattr(LR1AnalysisTable(grammar, path, 'lr1'), 'cc')
+
+    rewrite_header(path, **changes)
+    rebuilt = LR1AnalysisTable(grammar, path, 'lr1')
+    assert hasattr(rebuilt, 'cc')
+    assert rebuilt.dense() == built.dense()
+    with open(path, 'rb') as f:
+        header, _ = LR1AnalysisTable.binary_header(f.read())
+    assert header['fingerprint'] == grammar.fingerprint()
+    assert header['version'] == LR1AnalysisTable.BINARY_VERSION
+
+def lr1_not_lalr1_grammar()->Grammar:
+    """LR(1) but not LALR(1): merging the two states after `a c` and `b c` mixes the reductions of A and B"""
+    rcf = RuleComponentFactory()
+    P, S, A, B = rcf.non_terminal("P"), rcf.non_terminal("S"), rcf.non_terminal("A"), rcf.non_terminal("B")
+    a, b, c, d, e = map(rcf.terminal, "abcde")
+    return Grammar([P << S, S << a * A * d, S << b * B * d, S << a * B * e, S << b * A * e, A << c, B << c])
+
+def test_lalr1_reports_the_conflict_of_an_lr1_grammar():
+    grammar = lr1_not_lalr1_grammar()
+    with pytest.raises(RuntimeError):
+        LR1AnalysisTable(grammar, None, 'lalr1')
+    lalr1 = LR1AnalysisTable(grammar, None, 'lalr1', check_conflicts=False)
+    assert len(lalr1.find_conflicts()) > 0
+    for mode in ('lr1', 'ielr1'):
+        assert LR1AnalysisTable(grammar, None, mode).find_conflicts() == []
+
+def test_compare_modes():
+    result = {mode: rest for mode, *rest in LR1AnalysisTable.compare_modes(lr1_not_lalr1_grammar())}
+    assert set(result) == set(LR1AnalysisTable.MODES)
+    (lr1_states, _, lr1_conflicts), (lalr1_states, _, lalr1_conflicts), (ielr1_states, _, ielr1_conflicts) \
+        = result['lr1'], result['lalr1'], result['ielr1']
+    assert lr1_conflicts == ielr1_conflicts == 0 and lalr1_conflicts > 0
+    assert lalr1_states < ielr1_states <= lr1_states
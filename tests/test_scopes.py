@@ -0,0 +1,99 @@
+import os
+from conftest import EXAMPLES_DIR
+from cels_modular import ModularCels2AST
+
+def build(example:str)->ModularCels2AST:
+    folder = os.path.abspath(os.path.join(EXAMPLES_DIR, example, "cels"))
+    builder = ModularCels2AST()
+    builder.import_solver.base_dir = folder
+    with open(os.path.join(folder, "celstris.cels")) as f:
+        builder.build_ast(f.read())
+    return builder
+
+def iids(builder:ModularCels2AST)->dict[str, int]:
+    result = {}
+    def walk(scope):
+        result[scope.get_full_name()] = scope.iid
+        for symbol in scope.enumerate_symbols():
+            result[symbol.get_full_name()] = symbol.iid
+        for child in scope.enumerate_subscopes(): walk(child)
+    walk(builder.env.global_scope)
+    return result
+
+def test_builds_get_the_same_iids():
+    build("extern_struct")
+    first, second = build("gba_celstris"), build("gba_celstris")
+    assert iids(first) == iids(second)
+    # each environment interns its own names only
+    interner = first.env.global_scope.interner
+    assert first.env.global_scope.iid == 1
+    assert max(iids(first).values()) <= len(interner)
+    assert interner is not second.env.global_scope.interner
+
+def test_objects_of_other_environments_are_not_equal():
+    from cels_env import CelsEnvironment
+    from cels_symbols import PointerType
+    env_a, env_b = CelsEnvironment.create_default(), CelsEnvironment.create_default()
+    int_ptr, float_ptr = PointerType(env_a.dtype_int), PointerType(env_b.dtype_float)
+    # the same ids in both environments
+    assert int_ptr.iid == float_ptr.iid
+    assert int_ptr != float_ptr
+    assert env_a.dtype_int != env_b.dtype_int
+    assert env_a.global_scope != env_b.global_scope
+    assert env_a.dtype_int == env_a.dtype_int and int_ptr == PointerType(env_a.dtype_int)
+
+def test_rollback_undoes_visible_scopes_and_metadata():
+    from cels_env import CelsEnvironment
+    from cels_symbols import Variable
+    from cels_scope import ScopeException
+    import pytest
+    env = CelsEnvironment.create_default()
+    glb = env.global_scope
+    outer, other = glb.get_subscope("outer"), glb.get_subscope("other")
+    env.add_symbol(other, lambda scope: Variable("x", scope, env.dtype_int))
+
+    checkpoint = env.checkpoint()
+    outer.add_visible_scope(other)
+    outer.set_metadata('type', 'package')
+    assert outer.resolve_symbol("x").scope == other
+    env.rollback(checkpoint)
+
+    assert not 'type' in outer.metadata
+    with pytest.raises(ScopeException):
+        outer.resolve_symbol("x")
+
+def test_resolution_cache_sees_shadowing_symbols():
+    from cels_env import CelsEnvironment
+    from cels_symbols import Variable
+    env = CelsEnvironment.create_default()
+    glb = env.global_scope
+    cache = glb.resolution_cache
+    inner = glb.get_subscope("outer").get_subscope("inner")
+    outer_x = env.add_symbol(glb, lambda scope: Variable("x", scope, env.dtype_int))
+
+    hits, misses = cache.hits, cache.misses
+    assert inner.resolve_symbol("x") is outer_x
+    assert (cache.hits, cache.misses) == (hits, misses+1)
+    assert inner.resolve_symbol("x") is outer_x
+    assert (cache.hits, cache.misses) == (hits+1, misses+1)
+
+    inner_x = env.add_symbol(inner, lambda scope: Variable("x", scope, env.dtype_int))
+    assert inner.resolve_symbol("x") is inner_x
+    assert (cache.hits, cache.misses) == (hits+1, misses+2)
+    assert cache.stats() == {'hits': cache.hits, 'misses': cache.misses, 'entries': 1}
+
+def test_rollback_clears_the_resolution_cache():
+    from cels_env import CelsEnvironment
+    from cels_symbols import Variable
+    env = CelsEnvironment.create_default()
+    glb = env.global_scope
+    inner = glb.get_subscope("inner")
+    outer_x = env.add_symbol(glb, lambda scope: Variable("x", scope, env.dtype_int))
+
+    checkpoint = env.checkpoint()
+    inner_x = env.add_symbol(inner, lambda scope: Variable("x", scope, env.dtype_int))
+    assert inner.resolve_symbol("x") is inner_x
+    env.rollback(checkpoint)
+
+    assert glb.resolution_cache.stats()['entries'] == 0
+    assert inner.resolve_symbol("x") is outer_x